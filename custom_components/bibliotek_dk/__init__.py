@@ -3,9 +3,18 @@ from __future__ import annotations
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.update_coordinator import UpdateFailed
 
+import asyncio
+import logging
+
+from .covers import async_setup_covers
 from .library_api import Library
+from .services import async_setup_services
+from .storage import DATA_STORES, libraryStore
+from .websocket import async_setup_websocket
 
 from .const import (
     CONF_AGENCY,
@@ -14,17 +23,56 @@ from .const import (
     CONF_PINCODE,
     CONF_USER_ID,
     DOMAIN,
+    MAX_PARALLEL_UPDATES,
+    UPDATE_GRACE,
 )
 
+DATA_UPDATE_SLOTS = f"{DOMAIN}_update_slots"
 PLATFORMS = [Platform.SENSOR]
 
+_LOGGER = logging.getLogger(__name__)
+
+
+# Shared by all the accounts, only a few may talk to the libraries at once
+@callback
+def async_get_update_slots(hass: HomeAssistant) -> asyncio.Semaphore:
+    if DATA_UPDATE_SLOTS not in hass.data:
+        hass.data[DATA_UPDATE_SLOTS] = asyncio.Semaphore(MAX_PARALLEL_UPDATES)
+    return hass.data[DATA_UPDATE_SLOTS]
+
+
+# Run the update of an account in turn with the others, and return what changed.
+# The update keeps its own budget, the timeout is the last resort if it does not.
+async def async_run_update(hass: HomeAssistant, myLibrary: Library) -> dict:
+    # Wait for a free slot, only a few accounts updates at once
+    async with async_get_update_slots(hass):
+        job = hass.async_add_executor_job(myLibrary.update)
+        try:
+            async with asyncio.timeout(myLibrary.budget + UPDATE_GRACE):
+                await asyncio.shield(job)
+        except TimeoutError as err:
+            _LOGGER.warning(
+                "(%s) Update did not finish in %s seconds, cancelling it",
+                myLibrary.user.userId[:-4],
+                myLibrary.budget + UPDATE_GRACE,
+            )
+            myLibrary.cancel()
+            # Keep the slot until the update has actually stopped
+            await asyncio.wait((job,))
+            raise UpdateFailed(
+                f"Update did not finish in {myLibrary.budget + UPDATE_GRACE} seconds"
+            ) from err
+    # Only the call which ran the update gets what changed
+    return job.result()
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     """Set up Bibliotek from a config entry."""
     hass.data.setdefault(DOMAIN, {})
+    hass.data.setdefault(DATA_STORES, {})
 
-    hass.data[DOMAIN][entry.entry_id] = Library(
+    myLibrary = Library(
         entry.data[CONF_USER_ID],
         entry.data[CONF_PINCODE],
         entry.data[CONF_HOST],
@@ -32,6 +80,34 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         agency=entry.data[CONF_AGENCY],
     )
 
+    # Restore the profile of the user from the last run
+    store = libraryStore(hass, entry.entry_id)
+    await store.async_load()
+    if store.profile:
+        myLibrary.setProfile(store.profile)
+    # and the lists, served until the first update has finished
+    if store.snapshot:
+        myLibrary.setSnapshot(store.snapshot)
+
+    # Without a stored profile the names of the sensors are unknown,
+    # so the first update must get through before they are set up
+    if not myLibrary.user.name:
+        try:
+            await async_run_update(hass, myLibrary)
+        except UpdateFailed as err:
+            raise ConfigEntryNotReady(str(err)) from err
+        if myLibrary.libraryName is None or not myLibrary.user.name:
+            raise ConfigEntryNotReady(f"Unable to log in to {entry.data[CONF_HOST]}")
+        await store.async_save_profile(myLibrary.getProfile())
+        await store.async_save_snapshot(myLibrary.getSnapshot())
+
+    hass.data[DOMAIN][entry.entry_id] = myLibrary
+    hass.data[DATA_STORES][entry.entry_id] = store
+
+    async_setup_services(hass)
+    async_setup_websocket(hass)
+    await async_setup_covers(hass)
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     return True
@@ -41,5 +117,11 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
         hass.data[DOMAIN].pop(entry.entry_id)
+        hass.data[DATA_STORES].pop(entry.entry_id)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the stored data of a config entry."""
+    await libraryStore(hass, entry.entry_id).async_remove()
@@ -0,0 +1,197 @@
+"""Cached catalogue of the libraries used by the config flow."""
+from __future__ import annotations
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from datetime import timedelta
+
+import json
+import logging
+import requests
+
+from .const import (
+    CATALOGUE_RETRY,
+    CATALOGUE_TTL,
+    DOMAIN,
+    FETCH_TIMEOUT,
+    HEADERS,
+    MUNICIPALITY_LOOKUP_REMOTE,
+    MUNICIPALITY_LOOKUP_URL,
+)
+from .libraries import (
+    fetchLibraries,
+    libraryIndex,
+    loadSnapshot,
+    mergeDirectory,
+    splitDirectory,
+)
+from .municipalities import municipalityFromCoor
+
+STORAGE_KEY = f"{DOMAIN}_catalogue"
+STORAGE_VERSION = 1
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# Reverse geocode the coordinates into the name of the municipality
+def fetchMunicipality(lon, lat) -> str | None:
+    session = requests.Session()
+    session.headers = dict(HEADERS)
+    url = MUNICIPALITY_LOOKUP_URL.replace("LON", str(lon)).replace("LAT", str(lat))
+
+    try:
+        r = session.get(url, timeout=FETCH_TIMEOUT)
+        r.raise_for_status()
+        municipality = json.loads(r.text)
+    except requests.exceptions.Timeout:
+        _LOGGER.error("Timeout fecthing (%s)", url)
+        return None
+    except requests.exceptions.TooManyRedirects:
+        _LOGGER.error("Too many redirects fecthing (%s)", url)
+        return None
+    except (requests.exceptions.RequestException, ValueError) as err:
+        _LOGGER.error("Request Exception while fetching (%s): %s", url, err)
+        return None
+    finally:
+        session.close()
+
+    return municipality["navn"] if "navn" in municipality else ""
+
+
+class libraryCatalogue:
+    """The libraries, the gatewayf exclusions and the home municipality.
+
+    The catalogue is kept in the HA storage, so the config flow can open
+    instantly and work from the last good copy. A stale copy is served
+    as is while a refresh runs in the background. Without any copy the
+    snapshot bundled with the integration is used.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._refreshTask = None
+        self.directory, self.index = [], libraryIndex([])
+        self.libraries, self.excLibraries = {}, {}
+        self.municipality, self.coordinates = "", None
+        self.updated = None
+        # The time of the last failed refresh, and of the failed lookup by coordinates
+        self._refreshFailed, self._lookupFailed = None, {}
+
+    # The library of the home municipality
+    @property
+    def homeLibrary(self) -> str | None:
+        return self.index.resolve(self.municipality)
+
+    # The usable library from the name of a library or a municipality
+    def lookup(self, name: str) -> dict | None:
+        return self.libraries.get(self.index.resolve(name))
+
+    @property
+    def stale(self) -> bool:
+        return not self.updated or dt_util.utcnow() - self.updated > timedelta(
+            hours=CATALOGUE_TTL
+        )
+
+    async def async_load(self) -> None:
+        if data := await self._store.async_load():
+            self._setDirectory(data["directory"])
+            self.municipality = data["municipality"]
+            self.coordinates = data["coordinates"]
+            if data["updated"]:
+                self.updated = dt_util.parse_datetime(data["updated"])
+
+        # Without any copy start from the bundled snapshot
+        if not self.directory:
+            self._setDirectory(await self.hass.async_add_executor_job(loadSnapshot))
+
+        # Without any libraries at all we have to wait for the first copy
+        if not self.libraries:
+            await self.async_refresh()
+        elif self.stale:
+            self.async_schedule_refresh()
+
+    # Refresh in the background, not again right after a failed refresh
+    def async_schedule_refresh(self) -> None:
+        if self._retryLater(self._refreshFailed):
+            return
+        if self._refreshTask is None or self._refreshTask.done():
+            self._refreshTask = self.hass.async_create_task(self.async_refresh())
+
+    def _retryLater(self, failed) -> bool:
+        return failed is not None and dt_util.utcnow() - failed < timedelta(
+            minutes=CATALOGUE_RETRY
+        )
+
+    async def async_refresh(self) -> bool:
+        directory = await self.hass.async_add_executor_job(fetchLibraries)
+        if not directory:
+            _LOGGER.warning("Unable to refresh the libraries, using the last good copy")
+            self._refreshFailed = dt_util.utcnow()
+            return False
+        self._refreshFailed = None
+
+        directory, changes = mergeDirectory(self.directory, directory)
+        _LOGGER.debug("Refreshed the libraries, added/changed/removed: %s", changes)
+        self._setDirectory(directory)
+        self.updated = dt_util.utcnow()
+        # A new copy of the libraries means a new lookup of the municipality
+        self.coordinates = None
+        if not await self.async_update_municipality():
+            await self._store.async_save(self._toDict())
+        return True
+
+    async def async_update_municipality(self) -> bool:
+        coordinates = [self.hass.config.longitude, self.hass.config.latitude]
+        if self.coordinates == coordinates:
+            return False
+        # Do not ask again for every form, when the lookup just failed
+        if self._retryLater(self._lookupFailed.get(tuple(coordinates))):
+            return False
+
+        # Look in the bundled boundaries first and ask the remote API if allowed
+        municipality = await self.hass.async_add_executor_job(
+            municipalityFromCoor, *coordinates
+        )
+        if municipality is None and MUNICIPALITY_LOOKUP_REMOTE:
+            municipality = await self.hass.async_add_executor_job(
+                fetchMunicipality, *coordinates
+            )
+        if municipality is None:
+            self._lookupFailed[tuple(coordinates)] = dt_util.utcnow()
+            return False
+
+        self._lookupFailed.pop(tuple(coordinates), None)
+        self.municipality, self.coordinates = municipality, coordinates
+        await self._store.async_save(self._toDict())
+        return True
+
+    def _setDirectory(self, directory: list) -> None:
+        self.directory, self.index = directory, libraryIndex(directory)
+        self.libraries, self.excLibraries = splitDirectory(directory)
+
+    def _toDict(self) -> dict:
+        return {
+            "directory": self.directory,
+            "municipality": self.municipality,
+            "coordinates": self.coordinates,
+            "updated": self.updated.isoformat() if self.updated else None,
+        }
+
+
+async def async_get_catalogue(hass: HomeAssistant) -> libraryCatalogue:
+    # One shared catalogue for every flow, loaded on first use
+    if STORAGE_KEY not in hass.data:
+        catalogue = libraryCatalogue(hass)
+        await catalogue.async_load()
+        hass.data[STORAGE_KEY] = catalogue
+    else:
+        catalogue = hass.data[STORAGE_KEY]
+        # Keep it fresh for as long as Home Assistant runs
+        if catalogue.stale or not catalogue.libraries:
+            catalogue.async_schedule_refresh()
+    # The home zone may have moved since the last lookup
+    await catalogue.async_update_municipality()
+    return catalogue
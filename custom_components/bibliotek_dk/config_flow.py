@@ -7,23 +7,20 @@ from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import entity_registry as er, selector
 from homeassistant import config_entries
 
-from .library_api import Library
-from bs4 import BeautifulSoup as BS
+from . import async_get_update_slots
+from .catalogue import async_get_catalogue, libraryCatalogue
+from .library_api import Library, libraryUnavailable
 from typing import Any
 
-import asyncio
-import json
 import logging
-import random
 import re
-import requests
 import voluptuous as vol
 
 
 from .const import (
     CONF_AGENCY,
-    CONF_BRANCH_ID,
     CONF_HOST,
+    CONF_MAX_MATERIALS,
     CONF_MUNICIPALITY,
     CONF_NAME,
     CONF_PINCODE,
@@ -34,32 +31,28 @@ from .const import (
     CONF_UPDATE_INTERVAL,
     CONF_USER_ID,
     DOMAIN,
-    HEADERS,
-    MUNICIPALITY_LOOKUP_URL,
+    MAX_MATERIALS,
     UPDATE_INTERVAL,
-    URL_FALLBACK,
-    URL_LOGIN_PAGE,
 )
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def validate_input(
-    hass: HomeAssistant, data: dict[str, Any], libraries
+    hass: HomeAssistant, data: dict[str, Any], catalogue: libraryCatalogue
 ) -> dict[str, Any]:
 
     # Retrieve HOST and UPDATE_INTERVAL
-    data[CONF_HOST] = libraries[data[CONF_MUNICIPALITY]][CONF_HOST]
+    library = catalogue.lookup(data[CONF_MUNICIPALITY])
+    if not library:
+        raise CannotConnect
+    data[CONF_HOST] = library[CONF_HOST]
     data[CONF_UPDATE_INTERVAL] = (
         data[CONF_UPDATE_INTERVAL] if data[CONF_UPDATE_INTERVAL] else UPDATE_INTERVAL
     )
 
     # Add agency for ereolen.dk if boolean is set
-    data[CONF_AGENCY] = (
-        libraries[data[CONF_MUNICIPALITY]][CONF_AGENCY]
-        if data[CONF_SHOW_E_LIBRARY]
-        else None
-    )
+    data[CONF_AGENCY] = library[CONF_AGENCY] if data[CONF_SHOW_E_LIBRARY] else None
 
     # Typecast userId and Pincode to string:
     data[CONF_USER_ID] = re.sub("\D", "", data[CONF_USER_ID])
@@ -75,16 +68,15 @@ async def validate_input(
         ):
             raise UserExist
 
-        # If instance is running wait...
-        while any(
-            libraryObj.running == True for libraryObj in hass.data[DOMAIN].values()
-        ):
-            await asyncio.sleep(random.randint(5, 10))
-
     myLibrary = Library(data[CONF_USER_ID], data[CONF_PINCODE], data[CONF_HOST])
-    # Try to login to test the credentails
-    if not await hass.async_add_executor_job(myLibrary.login):
-        raise InvalidAuth
+    # Try to login to test the credentails, in turn with the updates
+    try:
+        async with async_get_update_slots(hass):
+            loggedIn = await hass.async_add_executor_job(myLibrary.login)
+        if not loggedIn:
+            raise InvalidAuth
+    except libraryUnavailable as err:
+        raise CannotConnect from err
     del myLibrary
 
     # Return info that you want to store in the config entry.
@@ -105,109 +97,20 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
 
-        # Fetch the list of libraries from a "fallback" loginpage
-        def refreshLibraries() -> tuple:
-            session = requests.Session()
-            session.headers = HEADERS
-
-            try:
-                r = session.get(URL_FALLBACK + URL_LOGIN_PAGE)
-                r.raise_for_status()
-
-            except requests.exceptions.HTTPError as err:
-                raise SystemExit(err) from err
-            except requests.exceptions.Timeout:
-                _LOGGER.error("Timeout fecthing (%s)", URL_FALLBACK + URL_LOGIN_PAGE)
-            except requests.exceptions.TooManyRedirects:
-                _LOGGER.error(
-                    "Too many redirects fecthing (%s)", URL_FALLBACK + URL_LOGIN_PAGE
-                )
-            except requests.exceptions.RequestException as err:
-                raise SystemExit(err) from err
-
-            try:
-                soup = BS(r.text, "html.parser")
-                librariesJSON = json.loads(
-                    soup.find(
-                        "script",
-                        text=re.compile(
-                            r"^var libraries = (.)", re.MULTILINE | re.DOTALL
-                        ),
-                    ).string.replace("var libraries = ", "")
-                )
-            except (AttributeError, KeyError) as err:
-                _LOGGER.error(
-                    "Error loading the libraries from the fallback url. Error: %s", err
-                )
-
-            libraries, excLibraries = {}, {}
-            if "folk" in librariesJSON.keys():
-                for library in librariesJSON["folk"]:
-                    p = re.compile("^.+?[^\/:](?=[?\/]|$)")
-                    m = p.match(library["registrationUrl"])
-                    # Only use libraries NOT using gatewayf
-                    if "gatewayf" not in library["registrationUrl"]:
-                        libraries[library[CONF_NAME]] = {
-                            CONF_AGENCY: library[CONF_BRANCH_ID],
-                            CONF_HOST: m.group(),
-                        }
-                    else:
-                        excLibraries[library[CONF_NAME]] = {
-                            CONF_AGENCY: library[CONF_BRANCH_ID],
-                            CONF_HOST: m.group(),
-                        }
-
-            return libraries, excLibraries
-
-        def municipalityFromCoor(lon, lat):
-            session = requests.Session()
-            session.headers = HEADERS
-
-            try:
-                r = session.get(
-                    MUNICIPALITY_LOOKUP_URL.replace("LON", str(lon)).replace(
-                        "LAT", str(lat)
-                    )
-                )
-                r.raise_for_status()
-
-            except requests.exceptions.HTTPError as err:
-                _LOGGER.error(f"HTTP Error while fetching (%s): {err}",URL_FALLBACK + URL_LOGIN_PAGE)
-                # Handle the error as needed, e.g., raise it, log it, or notify the user.
-                return ""
-            except requests.exceptions.Timeout:
-                _LOGGER.error("Timeout fecthing (%s)", URL_FALLBACK + URL_LOGIN_PAGE)
-            except requests.exceptions.TooManyRedirects:
-                _LOGGER.error(
-                    "Too many redirects fecthing (%s)", URL_FALLBACK + URL_LOGIN_PAGE
-                )
-            except requests.exceptions.RequestException as err:
-                _LOGGER.error(f"Request Exception while fetching (%s): {err}",URL_FALLBACK + URL_LOGIN_PAGE)
-                return ""
-
-            municipality = json.loads(r.text)
-            return municipality["navn"] if "navn" in municipality else ""
-
-        # Async fetch list of "folk" libraries
-        libraries, excLibraries = await self.hass.async_add_executor_job(
-            refreshLibraries
-        )
+        # Use the cached catalogue of libraries and the home municipality
+        catalogue = await async_get_catalogue(self.hass)
+        libraries, excLibraries = catalogue.libraries, catalogue.excLibraries
+        municipality = catalogue.homeLibrary
 
         errors = {}
-        try:
-            municipality = await self.hass.async_add_executor_job(
-                municipalityFromCoor,
-                self.hass.config.longitude,
-                self.hass.config.latitude,
-            )
-            if municipality in excLibraries.keys():
-                raise gatewayf
-        except gatewayf:
+        if not libraries:
+            errors["base"] = "cannot_connect"
+        elif municipality in excLibraries:
             errors["base"] = "gatewayf"
 
         if user_input is not None:
             try:
-                info = await validate_input(self.hass, user_input, libraries)
+                info = await validate_input(self.hass, user_input, catalogue)
             except UserExist:
                 errors["base"] = "user_exist"
             except CannotConnect:
@@ -226,7 +129,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 {
                     vol.Optional(CONF_NAME, default=""): str,
                     vol.Required(
-                        CONF_MUNICIPALITY, default=municipality
+                        CONF_MUNICIPALITY, default=municipality or ""
                     ): selector.SelectSelector(
                         selector.SelectSelectorConfig(
                             options=list(libraries.keys()),
@@ -242,6 +145,9 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     vol.Required(CONF_SHOW_RESERVATIONS, default=True): bool,
                     #                    vol.Required(CONF_SHOW_RESERVATIONS_READY, default=True): bool,
                     vol.Optional(CONF_UPDATE_INTERVAL, default=UPDATE_INTERVAL): int,
+                    vol.Optional(CONF_MAX_MATERIALS, default=MAX_MATERIALS): vol.All(
+                        int, vol.Range(min=1)
+                    ),
                 }
             ),
             errors=errors,
@@ -1,6 +1,12 @@
+BREAKER_COOLDOWN = 300  # seconds
+BREAKER_THRESHOLD = 3  # failed fetches in a row
+
+CATALOGUE_RETRY = 15  # minutes before a failed lookup is tried again
+CATALOGUE_TTL = 24 * 7  # hours
 CONF_AGENCY = "agency"
 CONF_BRANCH_ID = "branchId"
 CONF_HOST = "host"
+CONF_MAX_MATERIALS = "max_materials"
 CONF_MUNICIPALITY = "municipality"
 CONF_NAME = "name"
 CONF_PINCODE = "pincode"
@@ -10,21 +16,56 @@ CONF_SHOW_LOANS = "show_loans"
 CONF_SHOW_RESERVATIONS = "show_reservations"
 CONF_UPDATE_INTERVAL = "update_interval"
 CONF_USER_ID = "user_id"
+COVER_CACHE_SIZE = 500  # covers
+COVER_RETRY = 10  # minutes before a failed cover is fetched again
+COVER_SIZE = 300  # pixels
 CREDITS = "J-Lindvig (https://github.com/J-Lindvig)"
 
 DOMAIN = "bibliotek_dk"
 
+EVENT_CHANGED = f"{DOMAIN}_changed"
+EVENT_LOAN_DUE_DATE_CHANGED = f"{DOMAIN}_loan_due_date_changed"
+EVENT_RESERVATION_READY = f"{DOMAIN}_reservation_ready"
+
+FETCH_BACKOFF = 1  # seconds, doubled for every retry
+FETCH_RETRIES = 2
+FETCH_TIMEOUT = (5, 20)  # seconds to connect and to read
+
 HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
     "Accept-Encoding": "gzip, deflate, br",
     "Accept-Language": "da,en-US;q=0.9,en;q=0.8",
+    "Connection": "keep-alive",
     "Dnt": "1",
     "Upgrade-Insecure-Requests": "1",
     "Referer": "https://www.google.dk/",
 }
 
+LOANS_OVERDUE_CHECK = 24  # hours between checking the overdue loans with the library
+
+MAX_MATERIALS = 20
+MAX_PARALLEL_UPDATES = 4  # accounts updating at the same time
+
+MUNICIPALITY_LOOKUP_REMOTE = True
 MUNICIPALITY_LOOKUP_URL = "https://api.dataforsyningen.dk/kommuner/reverse?x=LON&y=LAT"
 
+POOL_CONNECTIONS = 2  # hosts, the library and eReolen
+POOL_MAXSIZE = 4  # connections kept alive for each host
+PROFILE_TTL = 24 * 7  # hours
+
+RESERVATIONS_SINGLE_PAGE = True  # False to fetch the ready reservations on a page of its own
+
+SERVICE_GET_MATERIALS = "get_materials"
+SIGNAL_CHANGED = f"{DOMAIN}_changed_{{}}"
+
+STARTUP_STAGGER = 15  # seconds between the first refresh of each entry
+
+THUMBNAIL_HEIGHT = 90  # pixels
+THUMBNAIL_WIDTH = 60  # pixels
+
+UPDATE_BUDGET = 120  # seconds for a whole update of an account
+UPDATE_GRACE = 10  # seconds, before Home Assistant stops waiting for an update
+UPDATE_FRESHNESS = 30  # seconds a finished update is used instead of a new one
 UPDATE_INTERVAL = 60
 URL_FALLBACK = "https://fmbib.dk"
 URL_LOGIN = "/adgangsplatformen/login"
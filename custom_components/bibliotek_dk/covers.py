@@ -0,0 +1,337 @@
+"""Local cache and proxy of the covers of the materials."""
+from __future__ import annotations
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+
+from aiohttp import ClientError, web
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import random
+import secrets
+import time
+
+from .const import (
+    COVER_CACHE_SIZE,
+    COVER_RETRY,
+    COVER_SIZE,
+    DOMAIN,
+    THUMBNAIL_HEIGHT,
+    THUMBNAIL_WIDTH,
+    USER_AGENTS,
+)
+
+DATA_COVERS = f"{DOMAIN}_covers"
+URL_COVER = f"/api/{DOMAIN}/cover/{{key}}"
+URL_SPRITE = f"/api/{DOMAIN}/sprite/{{key}}"
+URL_THUMBNAIL = f"/api/{DOMAIN}/thumbnail/{{key}}"
+# The number of packed sprites kept in memory
+SPRITE_CACHE_SIZE = 50
+# The number of cover urls that can be served, the most recently published
+URL_CACHE_SIZE = 2 * COVER_CACHE_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# The name of the cached file of a cover, the same on every run
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def coverFile(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+# Resize to fit within COVER_SIZE and convert to WebP
+def resizeCover(data: bytes) -> bytes:
+    with Image.open(BytesIO(data)) as image:
+        image.thumbnail((COVER_SIZE, COVER_SIZE))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        result = BytesIO()
+        image.save(result, "WEBP", quality=80)
+    return result.getvalue()
+
+
+# A thumbnail of exactly THUMBNAIL_WIDTH x THUMBNAIL_HEIGHT, padded if needed
+def makeThumbnail(data: bytes) -> Image.Image:
+    with Image.open(BytesIO(data)) as image:
+        return ImageOps.pad(
+            image.convert("RGBA"),
+            (THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT),
+            color=(0, 0, 0, 0),
+        )
+
+
+def toWebP(image: Image.Image) -> bytes:
+    result = BytesIO()
+    image.save(result, "WEBP", quality=80)
+    return result.getvalue()
+
+
+# Pack the thumbnails side by side, missing ones are left blank
+def packSprite(thumbnails: list) -> bytes:
+    sprite = Image.new(
+        "RGBA", (THUMBNAIL_WIDTH * max(len(thumbnails), 1), THUMBNAIL_HEIGHT)
+    )
+    for index, thumbnail in enumerate(thumbnails):
+        if thumbnail is not None:
+            sprite.paste(thumbnail, (index * THUMBNAIL_WIDTH, 0))
+    return toWebP(sprite)
+
+
+class coverCache:
+    """Covers fetched once, resized and kept on disk by their url.
+
+    Only covers of materials the integration knows of are served, so
+    the view cannot be used as an open proxy. The least recently used
+    covers are removed when there are more than COVER_CACHE_SIZE, and
+    only the URL_CACHE_SIZE most recently published urls are known.
+    A cover which could not be fetched is not tried for COVER_RETRY.
+
+    The views need no authentication, so the published keys are signed
+    with a secret of this run. Without it a key can not be made from the
+    url of a cover, to probe which materials are on the lists.
+
+    Thumbnails are made from the cached covers and kept in memory by the
+    hash of the content, so the same cover is only scaled once for all
+    the accounts. A sprite packs the thumbnails of a list of covers.
+    """
+
+    def __init__(self, hass: HomeAssistant, path: str) -> None:
+        self.hass = hass
+        self.path = path
+        self.urls, self.sprites = OrderedDict(), OrderedDict()
+        self._files = OrderedDict()
+        self._pending, self._failed = {}, {}
+        self._secret = secrets.token_bytes(32)
+        # The same urls are published on every render
+        self._sign = lru_cache(maxsize=URL_CACHE_SIZE)(self._hmac)
+        self._thumbnails, self._packed = OrderedDict(), OrderedDict()
+
+    def _load(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.is_file():
+                files.append((entry.stat().st_mtime, entry.name))
+        # Oldest first
+        for _, name in sorted(files):
+            self._files[name] = None
+
+    async def async_load(self) -> None:
+        await self.hass.async_add_executor_job(self._load)
+
+    def _hmac(self, value: str) -> str:
+        return hmac.new(self._secret, value.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    @callback
+    def _register(self, url: str) -> str:
+        key = self._sign(url)
+        self.urls[key] = url
+        self.urls.move_to_end(key)
+        while len(self.urls) > URL_CACHE_SIZE:
+            self.urls.popitem(last=False)
+        return key
+
+    # Return the local url of a cover
+    @callback
+    def register(self, url: str) -> str:
+        if not url:
+            return url
+        return URL_COVER.format(key=self._register(url))
+
+    # Return the local url of a sprite of the covers, in the given order
+    @callback
+    def registerSprite(self, urls: list) -> str:
+        keys = tuple(self._register(url) if url else None for url in urls)
+        key = self._hmac(repr(keys))
+        self.sprites[key] = keys
+        self.sprites.move_to_end(key)
+        while len(self.sprites) > SPRITE_CACHE_SIZE:
+            self.sprites.popitem(last=False)
+        return URL_SPRITE.format(key=key)
+
+    def _read(self, name: str) -> bytes | None:
+        try:
+            with open(os.path.join(self.path, name), "rb") as file:
+                data = file.read()
+            # Mark as recently used
+            os.utime(os.path.join(self.path, name))
+        except OSError:
+            return None
+        return data
+
+    def _write(self, name: str, data: bytes, expired: list) -> None:
+        with open(os.path.join(self.path, name), "wb") as file:
+            file.write(data)
+        for name in expired:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    async def async_get(self, key: str) -> bytes | None:
+        if (url := self.urls.get(key)) is None:
+            return None
+
+        # On disk the cover is kept by its url, the key changes with every run
+        name = coverFile(url)
+        if name in self._files:
+            self._files.move_to_end(name)
+            if (data := await self.hass.async_add_executor_job(self._read, name)):
+                return data
+            self._files.pop(name, None)
+
+        # Do not ask the library again and again for a cover it does not have
+        if time.monotonic() < self._failed.get(name, 0):
+            return None
+
+        # Only fetch each cover once, also when asked for at the same time
+        if (task := self._pending.get(name)) is None:
+            task = self.hass.async_create_task(self._async_fetch(url, name))
+            task.add_done_callback(lambda _: self._pending.pop(name, None))
+            self._pending[name] = task
+        return await asyncio.shield(task)
+
+    async def _async_fetch(self, url: str, name: str) -> bytes | None:
+        session = async_get_clientsession(self.hass)
+        try:
+            async with session.get(
+                url, headers={"User-Agent": random.choice(USER_AGENTS)}
+            ) as r:
+                r.raise_for_status()
+                data = await r.read()
+            data = await self.hass.async_add_executor_job(resizeCover, data)
+        except (ClientError, asyncio.TimeoutError, OSError, UnidentifiedImageError) as err:
+            _LOGGER.error("Error fetching the cover (%s). Error: (%s)", url, err)
+            now = time.monotonic()
+            # Forget the failures which may be tried again
+            self._failed = {k: t for k, t in self._failed.items() if t > now}
+            self._failed[name] = now + COVER_RETRY * 60
+            return None
+
+        self._files[name] = None
+        expired = []
+        while len(self._files) > COVER_CACHE_SIZE:
+            expired.append(self._files.popitem(last=False)[0])
+        await self.hass.async_add_executor_job(self._write, name, data, expired)
+
+        return data
+
+
+    async def _async_get_thumbnail(self, key: str | None) -> Image.Image | None:
+        if key is None or (data := await self.async_get(key)) is None:
+            return None
+
+        # Shared by every cover with the same content
+        contentHash = hashlib.sha1(data).hexdigest()
+        if contentHash in self._thumbnails:
+            self._thumbnails.move_to_end(contentHash)
+        else:
+            self._thumbnails[contentHash] = await self.hass.async_add_executor_job(
+                makeThumbnail, data
+            )
+            while len(self._thumbnails) > COVER_CACHE_SIZE:
+                self._thumbnails.popitem(last=False)
+        return self._thumbnails[contentHash]
+
+    async def async_get_thumbnail(self, key: str) -> bytes | None:
+        if (thumbnail := await self._async_get_thumbnail(key)) is None:
+            return None
+        return await self.hass.async_add_executor_job(toWebP, thumbnail)
+
+    async def async_get_sprite(self, key: str) -> bytes | None:
+        if (keys := self.sprites.get(key)) is None:
+            return None
+
+        if key not in self._packed:
+            thumbnails = await asyncio.gather(
+                *(self._async_get_thumbnail(cover) for cover in keys)
+            )
+            sprite = await self.hass.async_add_executor_job(packSprite, thumbnails)
+            # Try again next time if a cover could not be fetched
+            if any(t is None for t, cover in zip(thumbnails, keys) if cover):
+                return sprite
+            self._packed[key] = sprite
+            while len(self._packed) > SPRITE_CACHE_SIZE:
+                self._packed.popitem(last=False)
+        return self._packed[key]
+
+
+def _imageResponse(data: bytes | None) -> web.Response:
+    if data is None:
+        return web.Response(status=404)
+    return web.Response(
+        body=data,
+        content_type="image/webp",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+class CoverView(HomeAssistantView):
+    """Serve the cached covers."""
+
+    url = URL_COVER
+    name = f"api:{DOMAIN}:cover"
+    # Covers are loaded by <img> tags, which can not authenticate
+    requires_auth = False
+
+    def __init__(self, covers: coverCache) -> None:
+        self.covers = covers
+
+    async def get(self, request: web.Request, key: str) -> web.Response:
+        return _imageResponse(await self.covers.async_get(key))
+
+
+class ThumbnailView(CoverView):
+    """Serve the thumbnails of the cached covers."""
+
+    url = URL_THUMBNAIL
+    name = f"api:{DOMAIN}:thumbnail"
+
+    async def get(self, request: web.Request, key: str) -> web.Response:
+        return _imageResponse(await self.covers.async_get_thumbnail(key))
+
+
+class SpriteView(CoverView):
+    """Serve the thumbnails of a list of covers packed into one image."""
+
+    url = URL_SPRITE
+    name = f"api:{DOMAIN}:sprite"
+
+    async def get(self, request: web.Request, key: str) -> web.Response:
+        return _imageResponse(await self.covers.async_get_sprite(key))
+
+
+async def async_setup_covers(hass: HomeAssistant) -> None:
+    if DATA_COVERS in hass.data:
+        return
+    covers = coverCache(hass, hass.config.path(".cache", DOMAIN, "covers"))
+    hass.data[DATA_COVERS] = covers
+    await covers.async_load()
+    hass.http.register_view(CoverView(covers))
+    hass.http.register_view(ThumbnailView(covers))
+    hass.http.register_view(SpriteView(covers))
+
+
+# The local url of a cover, or the url itself if the cache is not set up
+@callback
+def coverUrl(hass: HomeAssistant, url: str) -> str:
+    if DATA_COVERS not in hass.data:
+        return url
+    return hass.data[DATA_COVERS].register(url)
+
+
+# The local url of a sprite of the covers, None if the cache is not set up
+@callback
+def spriteUrl(hass: HomeAssistant, urls: list) -> str | None:
+    if DATA_COVERS not in hass.data:
+        return None
+    return hass.data[DATA_COVERS].registerSprite(urls)
@@ -0,0 +1,38 @@
+"""The events of the changes found by an update."""
+from __future__ import annotations
+
+from .const import EVENT_CHANGED, EVENT_LOAN_DUE_DATE_CHANGED, EVENT_RESERVATION_READY
+from .library_api import LOANS, RESERVATIONS_READY
+
+
+# The events of the changes of every list, as (event type, event data)
+def changeEvents(changes: dict, data: dict):
+    for key, (added, removed, changed) in changes.items():
+        listData = {**data, "list": key.lower()}
+        for change, materials in (("added", added), ("removed", removed)):
+            for material in materials:
+                yield EVENT_CHANGED, {
+                    **listData,
+                    "change": change,
+                    "material": material.asDict(),
+                }
+        for material, fields in changed:
+            yield EVENT_CHANGED, {
+                **listData,
+                "change": "changed",
+                "material": material.asDict(),
+                "fields": {field: list(values) for field, values in fields.items()},
+            }
+
+        # The changes worth an event of their own
+        if key == RESERVATIONS_READY:
+            for material in added:
+                yield EVENT_RESERVATION_READY, {**listData, "material": material.asDict()}
+        elif key == LOANS:
+            for material, fields in changed:
+                if "expireDate" in fields:
+                    yield EVENT_LOAN_DUE_DATE_CHANGED, {
+                        **listData,
+                        "material": material.asDict(),
+                        "old_expire_date": fields["expireDate"][0],
+                    }
@@ -0,0 +1,174 @@
+"""The directory of the Danish libraries, live and bundled with the integration."""
+from __future__ import annotations
+
+from bs4 import BeautifulSoup as BS
+from functools import lru_cache
+
+import json
+import logging
+import os
+import re
+import requests
+
+from .const import (
+    CONF_AGENCY,
+    CONF_BRANCH_ID,
+    CONF_HOST,
+    CONF_NAME,
+    FETCH_TIMEOUT,
+    HEADERS,
+    URL_FALLBACK,
+    URL_LOGIN_PAGE,
+)
+
+SNAPSHOT_FILE = os.path.join(os.path.dirname(__file__), "libraries.json")
+SNAPSHOT_VERSION = 1
+
+# The host part of the registration url of a library
+HOST_PATTERN = re.compile(r"^.+?[^\/:](?=[?\/]|$)")
+# Words in the name of a library not found in the name of the municipality
+NAME_NOISE = re.compile(
+    r"\b(bibliotekerne|biblioteker|bibliotek|kommunes|kommune|og|borgerservice)\b"
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# Fetch the list of libraries from a "fallback" loginpage
+def fetchLibraries() -> list | None:
+    session = requests.Session()
+    session.headers = dict(HEADERS)
+
+    try:
+        r = session.get(URL_FALLBACK + URL_LOGIN_PAGE, timeout=FETCH_TIMEOUT)
+        r.raise_for_status()
+    except requests.exceptions.Timeout:
+        _LOGGER.error("Timeout fecthing (%s)", URL_FALLBACK + URL_LOGIN_PAGE)
+        return None
+    except requests.exceptions.TooManyRedirects:
+        _LOGGER.error("Too many redirects fecthing (%s)", URL_FALLBACK + URL_LOGIN_PAGE)
+        return None
+    except requests.exceptions.RequestException as err:
+        _LOGGER.error(
+            "Request Exception while fetching (%s): %s",
+            URL_FALLBACK + URL_LOGIN_PAGE,
+            err,
+        )
+        return None
+    finally:
+        session.close()
+
+    try:
+        soup = BS(r.text, "html.parser")
+        librariesJSON = json.loads(
+            soup.find(
+                "script",
+                text=re.compile(r"^var libraries = (.)", re.MULTILINE | re.DOTALL),
+            ).string.replace("var libraries = ", "")
+        )
+    except (AttributeError, KeyError, ValueError) as err:
+        _LOGGER.error(
+            "Error loading the libraries from the fallback url. Error: %s", err
+        )
+        return None
+
+    directory = []
+    for library in librariesJSON.get("folk", []):
+        m = HOST_PATTERN.match(library["registrationUrl"])
+        directory.append(
+            {
+                CONF_NAME: library[CONF_NAME],
+                CONF_BRANCH_ID: library[CONF_BRANCH_ID],
+                CONF_HOST: m.group(),
+                "gatewayf": "gatewayf" in library["registrationUrl"],
+            }
+        )
+
+    return directory
+
+
+# Load the snapshot of the libraries bundled with the integration
+@lru_cache(maxsize=1)
+def loadSnapshot() -> list:
+    try:
+        with open(SNAPSHOT_FILE, encoding="utf-8") as file:
+            snapshot = json.load(file)
+    except FileNotFoundError:
+        # Only bundled in releases, made by scripts/generate_libraries.py
+        _LOGGER.debug("No bundled libraries (%s)", SNAPSHOT_FILE)
+        return []
+    except (OSError, ValueError) as err:
+        _LOGGER.error("Error loading the bundled libraries (%s): %s", SNAPSHOT_FILE, err)
+        return []
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        _LOGGER.error(
+            "The bundled libraries has version %s, expected %s",
+            snapshot.get("version"),
+            SNAPSHOT_VERSION,
+        )
+        return []
+
+    return snapshot["folk"]
+
+
+# Merge the live directory into a known one, keeping the known order
+def mergeDirectory(known: list, live: list) -> tuple:
+    liveByName = {library[CONF_NAME]: library for library in live}
+    merged, added, changed, removed = [], 0, 0, 0
+    for library in known:
+        if library[CONF_NAME] not in liveByName:
+            removed += 1
+            continue
+        liveLibrary = liveByName.pop(library[CONF_NAME])
+        if liveLibrary != library:
+            changed += 1
+        merged.append(liveLibrary)
+    # What is left is new
+    added = len(liveByName)
+    merged.extend(liveByName.values())
+
+    return merged, (added, changed, removed)
+
+
+# Split the directory into the usable libraries and those using gatewayf
+def splitDirectory(directory: list) -> tuple:
+    libraries, excLibraries = {}, {}
+    for library in directory:
+        # Only use libraries NOT using gatewayf
+        target = excLibraries if library["gatewayf"] else libraries
+        target[library[CONF_NAME]] = {
+            CONF_AGENCY: library[CONF_BRANCH_ID],
+            CONF_HOST: library[CONF_HOST],
+        }
+
+    return libraries, excLibraries
+
+
+# Reduce the name of a library or a municipality to a comparable key
+# "Faaborg-Midtfyn Bibliotekerne" and "Faaborg-Midtfyn" both give "faaborg midtfyn"
+def normalizeName(name: str) -> str:
+    name = NAME_NOISE.sub(" ", name.lower().replace("-", " "))
+    return " ".join(name.split())
+
+
+class libraryIndex:
+    """Lookups into the directory, built once for every copy of it."""
+
+    def __init__(self, directory: list) -> None:
+        self.byName = {}
+        for library in directory:
+            key = normalizeName(library[CONF_NAME])
+            self.byName[key] = library[CONF_NAME]
+            # "Københavns Biblioteker" belongs to "København"
+            if key.endswith("s"):
+                self.byName.setdefault(key[:-1], library[CONF_NAME])
+        # Exact names always win over the aliases
+        for library in directory:
+            self.byName[library[CONF_NAME]] = library[CONF_NAME]
+
+    # Return the name of the library from the name of a library or a municipality
+    def resolve(self, name: str) -> str | None:
+        if not name:
+            return None
+        return self.byName.get(name) or self.byName.get(normalizeName(name))
@@ -1,15 +1,38 @@
 from __future__ import annotations
 
 from bs4 import BeautifulSoup as BS
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from operator import attrgetter
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import itertools
 import logging
 import random
 import re
 import requests
+import sys
+import threading
+import time
+import weakref
 
 from .const import (
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
     CONF_AGENCY,
+    FETCH_BACKOFF,
+    FETCH_RETRIES,
+    FETCH_TIMEOUT,
     HEADERS,
+    LOANS_OVERDUE_CHECK,
+    POOL_CONNECTIONS,
+    POOL_MAXSIZE,
+    PROFILE_TTL,
+    RESERVATIONS_SINGLE_PAGE,
+    UPDATE_BUDGET,
+    UPDATE_FRESHNESS,
     URL_LOGIN_PAGE,
     URL_LOGIN_PAGE_ELIB,
     USER_AGENTS,
@@ -41,6 +64,17 @@ URLS = {
     USER_PROFILE: "/user/me/edit",
 }
 
+#### THE CACHED SORT KEY OF A MATERIAL
+SORT_KEY = attrgetter("sortKey")
+
+#### FIELDS OF THE MATERIALS, IN THE SHARED RECORD AND HOLDING DATES
+INFO_FIELDS = ("url", "coverUrl", "type", "title", "creators")
+DATE_FIELDS = frozenset({"createdDate", "expireDate", "feeDate", "loanDate", "pickupDate"})
+
+#### LISTS OF MATERIALS ON THE USER
+MATERIAL_LISTS = (LOANS, LOANS_OVERDUE, RESERVATIONS, RESERVATIONS_READY, DEBTS)
+SORTED_LISTS = (LOANS, LOANS_OVERDUE, RESERVATIONS, RESERVATIONS_READY)
+
 ### IDENTIFIERS FOR CONTENT DIVS
 DIVS = {
     DEBTS: "pane-debts",
@@ -50,6 +84,15 @@ DIVS = {
     RESERVATIONS_READY: "pane-reservations",
 }
 
+#### DETAILS ONLY FOUND ON RESERVATIONS READY FOR PICKUP
+READY_DETAILS = ("pickup-id", "pickup-date")
+
+#### THE NAMES OF THE SESSION COOKIES OF DRUPAL
+SESSION_COOKIES = ("SESS", "SSESS")
+
+#### BYTES READ AT THE TIME FROM A STREAMED PAGE
+STREAM_CHUNK_SIZE = 8192
+
 #### SEARCH STRINGS
 LOGGED_IN = "logget ind"
 LOGGED_IN_ELIB = "Logged-in"
@@ -60,100 +103,520 @@ _LOGGER: logging.Logger = logging.getLogger(__package__)
 _LOGGER = logging.getLogger(__name__)
 
 
-class Library:
-    host, libraryName, icon, user = None, None, None, None
-    loggedIn, eLoggedIn, running = False, False, False
+class libraryUnavailable(Exception):
+    """Error to indicate the library could not be reached."""
+
+
+class circuitBreaker:
+    """Fail fast on a host which keeps failing.
+
+    After BREAKER_THRESHOLD failed fetches in a row the breaker opens,
+    and every fetch fails at once for BREAKER_COOLDOWN seconds. Then a
+    single fetch is let through, closing the breaker again on success.
+    """
+
+    def __init__(self) -> None:
+        self.failures, self.openUntil = 0, 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < BREAKER_THRESHOLD:
+                return True
+            if time.monotonic() >= self.openUntil:
+                # Let this one through, the rest waits for the next cooldown
+                self.openUntil = time.monotonic() + BREAKER_COOLDOWN
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= BREAKER_THRESHOLD:
+                self.openUntil = time.monotonic() + BREAKER_COOLDOWN
+
+
+# One circuit breaker for every host, shared by all the accounts
+_BREAKERS, _BREAKERS_LOCK = {}, threading.Lock()
+
+
+def getBreaker(url: str) -> circuitBreaker:
+    host = urlparse(url).netloc
+    with _BREAKERS_LOCK:
+        return _BREAKERS.setdefault(host, circuitBreaker())
+
+
+class loginForm:
+    """The layout of the login form of a host, shared by all the accounts.
+
+    Every time the form is fetched its layout is learned again. Fields
+    whose value changes between two fetches are tokens, and the action
+    may change the same way. Only a form seen twice without any such
+    change can be posted directly, without fetching it first.
+    """
+
+    def __init__(self, action: str, fields: dict, libraryField=None) -> None:
+        self.action, self.fields, self.libraryField = action, fields, libraryField
+        self.tokens, self.stableAction, self.seen = set(), True, 1
+
+    def learn(self, action: str, fields: dict, libraryField=None) -> None:
+        self.tokens |= {
+            name
+            for name in fields.keys() | self.fields.keys()
+            if fields.get(name) != self.fields.get(name)
+        }
+        # The name of the field with the library may be a token itself
+        if libraryField != self.libraryField:
+            self.tokens.add(libraryField)
+        self.stableAction = self.stableAction and action == self.action
+        self.action, self.fields, self.libraryField = action, fields, libraryField
+        self.seen += 1
+
+    @property
+    def direct(self) -> bool:
+        return self.seen > 1 and self.stableAction and not self.tokens
+
+
+class markerReader:
+    """Read a streamed page until the marker, ex. "</head>", has been read."""
+
+    def __init__(self, marker: str) -> None:
+        self.marker, self.tail = marker, ""
+
+    # Return True when done, the marker may be split between two chunks
+    def feed(self, text: str) -> bool:
+        text = self.tail + text.lower()
+        self.tail = text[-len(self.marker) :]
+        return self.marker in text
+
+
+class paneReader(HTMLParser):
+    """Read a streamed page until the panes with the materials have closed.
+
+    The targets are (tag, class) pairs, done when every one of them has
+    been opened and closed again. Nothing is parsed before the first
+    mention of a target class, and a page without the targets is read
+    to the end, as without a reader.
+    """
+
+    def __init__(self, *targets) -> None:
+        super().__init__(convert_charrefs=False)
+        self.targets, self.open = list(targets), []
+        self.skipping, self.pending = True, ""
+
+    def feed(self, text: str) -> bool:
+        if self.skipping:
+            text = self.pending + text
+            found = [
+                i for i in (text.find(cls) for _, cls in self.targets) if i >= 0
+            ]
+            if not found:
+                # Keep enough to find the start of the tag of a target
+                self.pending = text[-4096:]
+                return False
+            self.skipping, self.pending = False, ""
+            text = text[max(text.rfind("<", 0, min(found)), 0) :]
+        super().feed(text)
+        return not self.targets and not self.open
+
+    # Count the depth of every open target, targets may be nested
+    def handle_starttag(self, tag, attrs) -> None:
+        for target in self.open:
+            target[1] += target[0] == tag
+        classes = (dict(attrs).get("class") or "").split()
+        for target in self.targets:
+            if tag == target[0] and target[1] in classes:
+                self.targets.remove(target)
+                self.open.append([tag, 1])
+                return
+
+    def handle_endtag(self, tag) -> None:
+        for target in self.open:
+            target[1] -= target[0] == tag
+        self.open = [target for target in self.open if target[1]]
+
+
+class materialInfo:
+    """The metadata of a material, shared by every account and update.
+
+    A record is never changed. When the library changes the metadata of
+    a material, a new record takes the place of the old one in the table.
+    """
+
+    __slots__ = ("url", "coverUrl", "type", "title", "creators", "__weakref__")
+
+    def __init__(self, url, coverUrl, type, title, creators) -> None:
+        self.url, self.coverUrl = url, coverUrl
+        self.type, self.title, self.creators = type, title, creators
+
+    def values(self) -> tuple:
+        return self.url, self.coverUrl, self.type, self.title, self.creators
+
+
+# The records of the materials by their url, kept only while in use
+_MATERIALS, _MATERIALS_LOCK = weakref.WeakValueDictionary(), threading.Lock()
+
+
+def internMaterialInfo(url, coverUrl, type, title, creators) -> materialInfo:
+    # Only a few types exist, share the strings as well
+    type = sys.intern(type) if type else type
+    values = (url, coverUrl, type, title, creators)
+    with _MATERIALS_LOCK:
+        info = _MATERIALS.get(url) if url else None
+        if info is None or info.values() != values:
+            info = materialInfo(*values)
+            if url:
+                _MATERIALS[url] = info
+        return info
+
+
+# The login forms of the hosts, by the url of the login page
+_LOGIN_FORMS, _LOGIN_FORMS_LOCK = {}, threading.Lock()
+
 
+def learnLoginForm(url: str, action: str, fields: dict, libraryField=None) -> None:
+    with _LOGIN_FORMS_LOCK:
+        if url in _LOGIN_FORMS:
+            _LOGIN_FORMS[url].learn(action, fields, libraryField)
+        else:
+            _LOGIN_FORMS[url] = loginForm(action, fields, libraryField)
+
+
+# The layout of the form, if it can be posted without fetching it first
+def getDirectLoginForm(url: str) -> loginForm | None:
+    with _LOGIN_FORMS_LOCK:
+        form = _LOGIN_FORMS.get(url)
+        return form if form and form.direct else None
+
+
+# The cached layout was rejected, start over with the full login
+def forgetLoginForm(url: str) -> None:
+    with _LOGIN_FORMS_LOCK:
+        _LOGIN_FORMS.pop(url, None)
+
+
+class Library:
     def __init__(
-        self, userId: str, pincode: str, host=str, libraryName=None, agency=None
+        self,
+        userId: str,
+        pincode: str,
+        host=str,
+        libraryName=None,
+        agency=None,
+        timeout=FETCH_TIMEOUT,
+        budget=UPDATE_BUDGET,
     ) -> None:
 
-        # Prepare a new session with a random user-agent
-        HEADERS["User-Agent"] = random.choice(USER_AGENTS)
+        # Prepare a new session with its own copy of the headers and a random user-agent
         self.session = requests.Session()
-        self.session.headers = HEADERS
+        self.session.headers = dict(HEADERS)
+        self.session.headers["User-Agent"] = random.choice(USER_AGENTS)
+        # Keep the connections to the library and eReolen alive between the pages
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Seconds to connect and to read, and for the whole update
+        self.timeout, self.budget = timeout, budget
+        self.deadline = None
+        self._cancelled = threading.Event()
 
         self.host = host
         self.host_elib = "https://ereolen.dk"
+        self.libraryName, self.icon = None, None
+        self.loggedIn, self.eLoggedIn = False, False
         self.user = libraryUser(userId=userId, pincode=pincode)
         self.municipality = libraryName
         self.agency = agency
+        self.profileUpdated = None
+        # Overdue loans are found from the loans, the page is only a check
+        self.deriveOverdue, self.overdueChecked = True, None
+        self.lastUpdate = None
+        # The data is from before a restart or a failed update
+        self.stale = False
+        # The running update, joined by every request for an update meanwhile
+        self._flight, self._flightLock = None, threading.Lock()
+        self._finished = None
+        self.collapsed = 0
+        # Bytes not downloaded in the last update, and the sizes of the pages
+        self.bytesSaved, self._pageSizes = 0, {}
+
+    # The update function is called from the coordinator from Home Assistant.
+    # Requests meanwhile join the running update, and requests right after
+    # get the result of the update just finished, so only one runs at once.
+    # Returns what changed, only to the caller whose update found it, so the
+    # callers who joined or came right after do not report it once more.
+    def update(self) -> dict:
+        with self._flightLock:
+            if self._flight is None and self._finished and (
+                time.monotonic() - self._finished < UPDATE_FRESHNESS
+            ):
+                self.collapsed += 1
+                return {}
+            flight, leader = self._flight, self._flight is None
+            if leader:
+                flight = self._flight = Future()
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            _LOGGER.debug("(%s) Joining the running update", self.user.userId[:-4])
+            flight.result()
+            return {}
 
-    # The update function is called from the coordinator from Home Assistant
-    def update(self):
+        try:
+            changes = self._runUpdate()
+        except BaseException as err:
+            # The joiners fail with the update they joined
+            with self._flightLock:
+                self._flight, self._finished = None, None
+            flight.set_exception(err)
+            raise
+
+        with self._flightLock:
+            self._flight = None
+            # Only an update which got through is worth serving again
+            self._finished = None if self.stale else time.monotonic()
+        flight.set_result(None)
+        return changes
+
+    def _runUpdate(self) -> dict:
         _LOGGER.debug("Updating (%s)", self.user.userId[:-4])
 
-        # Only one user can login at the time.
-        self.running = True
+        self._cancelled.clear()
+        self.deadline = time.monotonic() + self.budget
+        self.bytesSaved = 0
 
+        try:
+            return self._update()
+        except libraryUnavailable as err:
+            # Keep the data of the last update
+            _LOGGER.warning(
+                "(%s) Library unavailable, keeping the last data: %s",
+                self.user.userId[:-4],
+                err,
+            )
+            self.loggedIn = False
+            self.session.close()
+            self.stale = True
+            # Only an update which gets through finds any changes
+            return {}
+        finally:
+            self.deadline = None
+            _LOGGER.debug(
+                "(%s) Saved %s bytes by not downloading whole pages",
+                self.user.userId[:-4],
+                self.bytesSaved,
+            )
+
+    # Stop a running update at the next fetch, called from outside the thread
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def _update(self) -> dict:
+        changes = {}
         if self.login():
-            # Only fetch user info once
-            if not self.user.name:
+            # Keep the lists, to find what changed
+            previous = {key: self.getList(key) for key in MATERIAL_LISTS}
+
+            # Only fetch user info when missing or too old
+            if not self.user.name or self._profileStale():
                 self.fetchUserInfo()
 
             # Fetch the states of the user
-            self.user.loans = self.fetchLoans()
-            self.user.loansOverdue = self.fetchLoansOverdue()
-            self.user.reservations = self.fetchReservations()
-            self.user.reservationsReady = self.fetchReservationsReady()
-            self.user.debts, self.user.debtsAmount = self.fetchDebts()
+            loans = self.fetchLoans()
+            loansOverdue = self.fetchLoansOverdue(loans)
+            reservations, reservationsReady = self.fetchAllReservations()
+            debts, self.user.debtsAmount = self.fetchDebts()
 
             # Logout
             self.logout()
 
             # eReolen
+            eLoans, eReservations, eReservationsReady = [], [], []
             if self.municipality and self.agency:
                 loginResult, soup = self.login_eLib()
                 if loginResult:
                     if soup:
                         self.fecthELibUsedQuota(soup)
-                        self.user.loans.extend(self.fetchLoans(soup))
-                        self.user.reservations.extend(self.fetchReservations(soup))
-                        self.user.reservationsReady.extend(self.fetchReservationsReady(soup))
+                        eLoans = self.fetchLoans(soup)
+                        eReservations, eReservationsReady = self.fetchAllReservations(
+                            soup
+                        )
 
                     # Logout of eReolen
                     self.logout(self.host_elib + URLS[LOGOUT_ELIB])
 
-            # Sort the lists
-            self.sortLists()
-
-        self.running = False
-
-        return True
+                # Done with the page of eReolen
+                if soup:
+                    soup.decompose()
+
+            # Merge the library and eReolen
+            current = {
+                LOANS: loans + eLoans,
+                LOANS_OVERDUE: loansOverdue,
+                RESERVATIONS: reservations + eReservations,
+                RESERVATIONS_READY: reservationsReady + eReservationsReady,
+                DEBTS: debts,
+            }
+
+            # Find what has changed, this also swaps the unchanged materials
+            # for their previous instance, which keeps their sort key
+            diffs = {
+                key: diffMaterials(previous[key], current[key]) for key in MATERIAL_LISTS
+            }
+            # Nothing has changed on the very first update, it is all new
+            if self.lastUpdate:
+                changes = diffs
+
+            # Sort the lists, each stream is already mostly in order, which
+            # the sort detects and merges in close to linear time.
+            # Only the new and the changed materials need a sort key.
+            for key in SORTED_LISTS:
+                added, _, changed = diffs[key]
+                for material in added:
+                    material.buildSortKey()
+                for material, _ in changed:
+                    material.buildSortKey()
+                current[key].sort(key=SORT_KEY)
+
+            self.user.loans = current[LOANS]
+            self.user.loansOverdue = current[LOANS_OVERDUE]
+            self.user.reservations = current[RESERVATIONS]
+            self.user.reservationsReady = current[RESERVATIONS_READY]
+            self.user.debts = current[DEBTS]
+            self.lastUpdate, self.stale = datetime.now(), False
+
+        return changes
 
     #### PRIVATE BEGIN ####
     # Retrieve a webpage with either GET/POST
-    def _fetchPage(self, url=str, payload=None, return_r=False) -> BS | tuple:
-        try:
-            # If payload, use POST
-            if payload:
-                r = self.session.post(url, data=payload)
+    # Transient errors are retried with a jittered exponential backoff.
+    # Raises libraryUnavailable when the page could not be fetched, or
+    # right away while the circuit breaker of the host is open.
+    # With a reader the page is streamed, and only read until the reader is done.
+    def _fetchPage(
+        self, url=str, payload=None, return_r=False, reader=None
+    ) -> BS | tuple:
+        breaker = getBreaker(url)
+        if not breaker.allow():
+            raise libraryUnavailable(f"({urlparse(url).netloc}) is down, skipping {url}")
+
+        for attempt in range(FETCH_RETRIES + 1):
+            transient = True
+            timeout = self._timeout(url)
+            try:
+                # If payload, use POST
+                if payload:
+                    r = self.session.post(
+                        url, data=payload, timeout=timeout, stream=bool(reader)
+                    )
 
-            # else use GET
-            else:
-                r = self.session.get(url)
-
-            r.raise_for_status()
-
-        except requests.exceptions.HTTPError as err:
-            _LOGGER.error(f"HTTP Error while fetching {url}: {err}")
-            # Handle the error as needed, e.g., raise it, log it, or notify the user.
-            return None if return_r else None, None 
-        except requests.exceptions.Timeout:
-            _LOGGER.error("Timeout fecthing (%s)", url)
-            return None if return_r else None, None
-        except requests.exceptions.TooManyRedirects:
-            _LOGGER.error("Too many redirects fecthing (%s)", url)
-            return None if return_r else None, None
-        except requests.exceptions.RequestException as err:
-            _LOGGER.error(f"Request Exception while fetching {url}: {err}")
-            return None if return_r else None, None
+                # else use GET
+                else:
+                    r = self.session.get(url, timeout=timeout, stream=bool(reader))
+
+                r.raise_for_status()
+                text = self._readPage(url, r, reader) if reader else r.text
+                break
+
+            except requests.exceptions.HTTPError as err:
+                # Only errors of the server are worth a retry
+                status = err.response.status_code if err.response is not None else 0
+                transient, error = status >= 500 or status == 429, err
+            except (
+                requests.exceptions.Timeout,
+                requests.exceptions.ConnectionError,
+            ) as err:
+                error = err
+            except requests.exceptions.RequestException as err:
+                transient, error = False, err
+
+            # Running out of our own budget is not the fault of the host
+            if self._remaining() == 0:
+                raise libraryUnavailable(f"Out of time fetching {url}: {error}") from error
+
+            if not transient or attempt == FETCH_RETRIES:
+                if transient:
+                    breaker.failure()
+                raise libraryUnavailable(f"Unable to fetch {url}: {error}") from error
+
+            _LOGGER.debug("Retrying (%s) after error: %s", url, error)
+            # Wake up at once if cancelled while waiting
+            self._cancelled.wait(
+                min(random.uniform(0, FETCH_BACKOFF * 2**attempt), self._remaining())
+            )
+
+        breaker.success()
 
         if return_r:
-            return BS(r.text, "html.parser"), r
+            return BS(text, "html.parser"), r
 
         # Return HTML soup
-        return BS(r.text, "html.parser")
+        return BS(text, "html.parser")
+
+    # Read the streamed page until the reader is done, and count what was saved
+    def _readPage(self, url, r, reader) -> str:
+        r.encoding = r.encoding or "utf-8"
+        chunks = []
+        try:
+            for chunk in r.iter_content(STREAM_CHUNK_SIZE, decode_unicode=True):
+                chunks.append(chunk)
+                if reader.feed(chunk):
+                    break
+            # The length is of the body as sent, so is what has been read
+            if length := r.headers.get("Content-Length"):
+                self._pageSizes[url] = int(length)
+                self.bytesSaved += max(int(length) - r.raw.tell(), 0)
+        finally:
+            # Drops the connection if the page was not read to the end
+            r.close()
+        return "".join(chunks)
+
+    # Without a session cookie for the host, we can not be logged in
+    def _hasSession(self, url) -> bool:
+        host = urlparse(url).hostname or ""
+        return any(
+            cookie.name.startswith(SESSION_COOKIES)
+            and host.endswith(cookie.domain.lstrip("."))
+            for cookie in self.session.cookies
+        )
+
+    # Seconds left of the budget of the running update, None outside an update
+    def _remaining(self) -> float | None:
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    # The timeouts of the next request, never reaching past the deadline
+    def _timeout(self, url) -> tuple:
+        if self._cancelled.is_set():
+            raise libraryUnavailable(f"Cancelled before fetching {url}")
+        remaining = self._remaining()
+        if remaining is None:
+            return self.timeout
+        if remaining == 0:
+            raise libraryUnavailable(
+                f"The budget of {self.budget} seconds is spent before fetching {url}"
+            )
+        connect, read = self.timeout
+        return min(connect, remaining), min(read, remaining)
+
+    # Iterate the materials of a page, releasing the page when done,
+    # also if the iteration is stopped early
+    def _releasing(self, soup, materials):
+        try:
+            yield from materials
+        finally:
+            soup.decompose()
+
+    # The text of a tag as a plain str, which does not keep the soup alive
+    def _text(self, tag) -> str | None:
+        return None if tag.string is None else str(tag.string)
 
     # Search for given string in the HTML soup
     def _titleInSoup(self, soup, string) -> bool:
@@ -200,21 +663,24 @@ class Library:
         # Return the date
         return date
 
-    def sortLists(self):
-        # Sort the loans by expireDate and the Title
-        self.user.loans.sort(key=lambda obj: (obj.expireDate is None, obj.expireDate, obj.title))
-        # Sort the reservations
-        self.user.reservations.sort(
-            key=lambda obj: (
-                obj.queueNumber is None,
-                obj.queueNumber,
-                obj.createdDate is None,
-                obj.createdDate,
-                obj.title,
-            )
+    def getList(self, key) -> list:
+        return {
+            LOANS: self.user.loans,
+            LOANS_OVERDUE: self.user.loansOverdue,
+            RESERVATIONS: self.user.reservations,
+            RESERVATIONS_READY: self.user.reservationsReady,
+            DEBTS: self.user.debts,
+        }[key]
+
+    def _profileStale(self) -> bool:
+        return not self.profileUpdated or datetime.now() - self.profileUpdated > timedelta(
+            hours=PROFILE_TTL
+        )
+
+    def _overdueCheckDue(self) -> bool:
+        return not self.overdueChecked or datetime.now() - self.overdueChecked > timedelta(
+            hours=LOANS_OVERDUE_CHECK
         )
-        # Sort the reservations
-        self.user.reservationsReady.sort(key=lambda obj: (obj.pickupDate is None, obj.pickupDate, obj.title))
 
     def _getMaterials(self, soup, noodle="div[class*='material-item']") -> BS:
         try:
@@ -244,6 +710,12 @@ class Library:
             material.img["src"] if material.img else "",
         )
 
+    # The shared record of the metadata of the material
+    def _getMaterialRecord(self, material) -> materialInfo:
+        url, coverUrl = self._getMaterialUrls(material)
+        title, creators, type = self._getMaterialInfo(material)
+        return internMaterialInfo(url, coverUrl, type, title, creators)
+
     def _getMaterialInfo(self, material) -> tuple:
         materialTitle, materialCreators, materialType = "", "", ""
         # Some title have the type in "()", remove it
@@ -252,7 +724,7 @@ class Library:
         materialTitle = material.select_one("[class*='item-title']")
         try:
             if materialTitle:
-                materialTitle = materialTitle.string
+                materialTitle = self._text(materialTitle)
             if materialTitle and "(" in materialTitle:
                 materialTitle = materialTitle.split("(")[0].strip()
         except (AttributeError, KeyError) as err:
@@ -262,7 +734,7 @@ class Library:
         materialType = material.select_one("div[class=item-material-type]")
         try:
             if materialType:
-                materialType = materialType.string
+                materialType = self._text(materialType)
             # Ok, maybe it is a digital
             else:
                 materialType = material.select_one("span[class*='icon']")
@@ -271,17 +743,17 @@ class Library:
                         "This material is a (.+?) and", materialType["aria-label"]
                     )
                     # Yes, it is a digital
-                    if result:
-                        materialType = result.group(1)
+                    materialType = result.group(1) if result else ""
                 # I have no idea...
                 else:
                     materialType = ""
         except (AttributeError, KeyError) as err:
             _LOGGER.error("Error in getting the materialType. Error: (%s)", err)
+            materialType = ""
 
         materialCreators = material.select_one("div[class=item-creators]")
         try:
-            materialCreators = materialCreators.string if materialCreators else ""
+            materialCreators = self._text(materialCreators) if materialCreators else ""
         except (AttributeError, KeyError) as err:
             _LOGGER.error("Error in getting the materialCreators. Error: (%s)", err)
 
@@ -293,9 +765,9 @@ class Library:
         details = {}
         try:
             for li in material.find_all("li"):
-                details[" ".join(li["class"])] = li.select_one(
-                    "div[class=item-information-data]"
-                ).string
+                details[" ".join(li["class"])] = self._text(
+                    li.select_one("div[class=item-information-data]")
+                )
         except (AttributeError, KeyError) as err:
             _LOGGER.error(
                 "Error in getting the Details of af material. Error: (%s)", err
@@ -312,32 +784,56 @@ class Library:
     ####  PRIVATE END  ####
     def login(self):
 
-        # Test if we are logged in by fetching the main page
-        soup, r = self._fetchPage(url=self.host, return_r=True)
-        if r.status_code == 200:
+        # Test if we are logged in by reading the <head> of the main page.
+        # Without a session we are not, and the page is only needed for
+        # the name and the icon of the library.
+        if self.libraryName is not None and not self._hasSession(self.host):
+            self.loggedIn = False
+            self.bytesSaved += self._pageSizes.get(self.host, 0)
+        else:
+            soup, r = self._fetchPage(
+                url=self.host, return_r=True, reader=markerReader("</head>")
+            )
+            if r.status_code == 200:
+                self.loggedIn = self._titleInSoup(soup, LOGGED_IN)
+                # Retrieve the name of the Library from the title tag
+                # <title>Faaborg-Midtfyn Bibliotekerne | | Logget ind</title>
+                try:
+                    self.libraryName = soup.title.string.split("|")[0].strip()
+                except (AttributeError, KeyError) as err:
+                    _LOGGER.error(
+                        "Error in getting the title of the page (%s). Error: (%s)",
+                        self.host,
+                        err,
+                    )
 
-            self.loggedIn = self._titleInSoup(soup, LOGGED_IN)
-            # Retrieve the name of the Library from the title tag
-            # <title>Faaborg-Midtfyn Bibliotekerne | | Logget ind</title>
-            try:
-                self.libraryName = soup.title.string.split("|")[0].strip()
-            except (AttributeError, KeyError) as err:
-                _LOGGER.error(
-                    "Error in getting the title of the page (%s). Error: (%s)",
-                    self.host,
-                    err,
-                )
+                # Fetch the icon of the library
+                self.icon = soup.select_one("link[rel*='icon']")
+                self.icon = self.icon["href"] if self.icon else None
+            soup.decompose()
+
+        loginUrl = self.host + URL_LOGIN_PAGE
 
-            # Fetch the icon of the library
-            self.icon = soup.select_one("link[rel*='icon']")
-            self.icon = self.icon["href"] if self.icon else None
+        # Post directly to a known form without any tokens
+        if not self.loggedIn and (layout := getDirectLoginForm(loginUrl)):
+            payload = dict(layout.fields)
+            payload.update(self.user.userInfo)
+            try:
+                soup = self._fetchPage(layout.action, payload)
+                self.loggedIn = self._titleInSoup(soup, LOGGED_IN)
+                soup.decompose()
+            except libraryUnavailable as err:
+                _LOGGER.debug("Posting the known login form failed: %s", err)
+            # Rejected, fall back to the full login
+            if not self.loggedIn:
+                forgetLoginForm(loginUrl)
 
         if not self.loggedIn:
             # Fetch the loginpage and prepare a soup
-            soup, r = self._fetchPage(url=self.host + URL_LOGIN_PAGE, return_r=True)
+            soup, r = self._fetchPage(url=loginUrl, return_r=True)
 
             # Prepare the payload
-            payload = {}
+            payload, fields = {}, {}
             # Find the <form>
             try:
                 form = soup.find("form")
@@ -348,10 +844,14 @@ class Library:
                     # or pass default values to payload
                     else:
                         payload[inputTag["name"]] = inputTag["value"]
+                        fields[inputTag["name"]] = inputTag["value"]
 
                 # Send the payload as POST and prepare a new soup
                 # Use the URL from the response since we have been directed
-                soup = self._fetchPage(form["action"].replace("/login", r.url), payload)
+                action = form["action"].replace("/login", r.url)
+                soup.decompose()
+                soup = self._fetchPage(action, payload)
+                learnLoginForm(loginUrl, action, fields)
             except (AttributeError, KeyError) as err:
                 _LOGGER.error(
                     "Error processing the <form> tag and subtags (%s). Error: (%s)",
@@ -361,6 +861,7 @@ class Library:
 
             # Set loggedIn
             self.loggedIn = self._titleInSoup(soup, LOGGED_IN)
+            soup.decompose()
 
         if DEBUG:
             _LOGGER.debug("(%s) is logged in: %s", self.user.userId[:-4], self.loggedIn)
@@ -371,33 +872,55 @@ class Library:
         # Make sure we are logged OUT
         if self.loggedIn:
             self.logout()
-            return self.login_eLib()
-
-        # Test if we are logged in at eReolen.dk
-        soup, r = self._fetchPage(url=self.host_elib, return_r=True)
-        if r.status_code == 200:
-            self.eLoggedIn = self._titleInSoup(soup, LOGGED_IN_ELIB)
 
-        if not self.loggedIn:
+        # Test if we are logged in at eReolen.dk, from the <head> of the page
+        if not self._hasSession(self.host_elib):
+            self.eLoggedIn = False
+            self.bytesSaved += self._pageSizes.get(self.host_elib, 0)
+        else:
             soup, r = self._fetchPage(
-                url=self.host_elib + URL_LOGIN_PAGE_ELIB, return_r=True
+                url=self.host_elib, return_r=True, reader=markerReader("</head>")
             )
+            if r.status_code == 200:
+                self.eLoggedIn = self._titleInSoup(soup, LOGGED_IN_ELIB)
+            soup.decompose()
+
+        loginUrl = self.host_elib + URL_LOGIN_PAGE_ELIB
+        payload = dict(self.user.userInfo)
+        payload[CONF_AGENCY] = self.agency
+
+        # Post directly to a known form without any tokens
+        if not self.loggedIn and (layout := getDirectLoginForm(loginUrl)):
+            directPayload = dict(payload)
+            if layout.libraryField:
+                directPayload[layout.libraryField] = self.municipality
+            try:
+                soup = self._fetchPage(layout.action, directPayload)
+                self.loggedIn = self._titleInSoup(soup, LOGGED_IN_ELIB)
+                if not self.loggedIn:
+                    soup.decompose()
+            except libraryUnavailable as err:
+                _LOGGER.debug("Posting the known login form failed: %s", err)
+            # Rejected, fall back to the full login
+            if not self.loggedIn:
+                forgetLoginForm(loginUrl)
 
-            payload = self.user.userInfo
-            payload[CONF_AGENCY] = self.agency
+        if not self.loggedIn:
+            soup, r = self._fetchPage(url=loginUrl, return_r=True)
 
             try:
+                libraryField = None
                 libraryFormToken = soup.select_one("input[name*=libraryName-]")
                 if libraryFormToken:
-                    payload[libraryFormToken["name"]] = self.municipality
+                    libraryField = libraryFormToken["name"]
+                    payload[libraryField] = self.municipality
 
                 # Send the payload aka LOGIN
-                soup = self._fetchPage(
-                    soup.form["action"].replace("/login", r.url), payload
-                )
-                self.loggedIn = (
-                    soup if self._titleInSoup(soup, LOGGED_IN_ELIB) else False
-                )
+                action = soup.form["action"].replace("/login", r.url)
+                soup.decompose()
+                soup = self._fetchPage(action, payload)
+                learnLoginForm(loginUrl, action, {}, libraryField)
+                self.loggedIn = self._titleInSoup(soup, LOGGED_IN_ELIB)
             except (AttributeError, KeyError) as err:
                 _LOGGER.error(
                     "Error processing the <form> tag and subtags (%s). Error: (%s)",
@@ -412,15 +935,25 @@ class Library:
                 self.host_elib,
             )
 
+        # The page after the login holds the eLoans etc., the caller releases it
         return self.loggedIn, soup
 
     def logout(self, url=None):
         url = self.host + URLS[LOGOUT] if not url else url
         if self.loggedIn:
             # Fetch the logout page, if given a 200 (true) reverse it to false
-            self.loggedIn = not self.session.get(url).status_code == 200
-            if not self.loggedIn:
-                self.session.close()
+            try:
+                self.loggedIn = (
+                    not self.session.get(url, timeout=self._timeout(url)).status_code
+                    == 200
+                )
+            except (requests.exceptions.RequestException, libraryUnavailable) as err:
+                _LOGGER.error(f"Request Exception while logging out {url}: {err}")
+            # Only tried once, a session we could not log out of is dropped
+            if self.loggedIn:
+                self.session.cookies.clear()
+                self.loggedIn = False
+            self.session.close()
         if DEBUG:
             _LOGGER.debug(
                 "(%s) is logged OUT @%s: %s",
@@ -476,17 +1009,17 @@ class Library:
                 # Find the correct place for the field
                 key = fieldName.string.lower()
                 if key == "navn":
-                    self.user.name = fieldValue.string
+                    self.user.name = str(fieldValue.string)
                 elif key == "adresse":
-                    self.user.address = fieldValue.contents
+                    self.user.address = [str(line) for line in fieldValue.contents]
 
             # Find the correct <form>, extract info
             form = soup.select_one(f"form[action='{URLS[USER_PROFILE]}']")
-            self.user.phone = form.select_one("input[name*='phone]']")["value"]
+            self.user.phone = str(form.select_one("input[name*='phone]']")["value"])
             self.user.phoneNotify = (
                 int(form.select_one("input[name*='phone_notification']")["value"]) == 1
             )
-            self.user.mail = form.select_one("input[name*='mail]']")["value"]
+            self.user.mail = str(form.select_one("input[name*='mail]']")["value"])
             self.user.mailNotify = (
                 int(form.select_one("input[name*='mail_notification']")["value"]) == 1
             )
@@ -496,14 +1029,17 @@ class Library:
                 "option"
             ):
                 if "selected" in library.attrs:
-                    self.user.pickupLibrary = library.string
+                    self.user.pickupLibrary = str(library.string)
                     break
+
+            self.profileUpdated = datetime.now()
         except (AttributeError, KeyError) as err:
             _LOGGER.error(
                 "Error getting user info (%s). Error: (%s)",
                 self.host + URLS[USER_PROFILE],
                 err,
             )
+        soup.decompose()
 
         if DEBUG:
             _LOGGER.debug(
@@ -513,15 +1049,105 @@ class Library:
                 self.user.pickupLibrary,
             )
 
+    # The profile of the user as plain values, ready to be stored
+    def getProfile(self) -> dict:
+        return {
+            "libraryName": self.libraryName,
+            "icon": self.icon,
+            "name": self.user.name,
+            "address": self.user.address,
+            "phone": self.user.phone,
+            "phoneNotify": self.user.phoneNotify,
+            "mail": self.user.mail,
+            "mailNotify": self.user.mailNotify,
+            "pickupLibrary": self.user.pickupLibrary,
+            "updated": self.profileUpdated.isoformat() if self.profileUpdated else None,
+        }
+
+    # The lists, the quotas and the debt amount, ready to be stored.
+    # Every list is stored as rows of values, with the names of the fields once.
+    def getSnapshot(self) -> dict:
+        return {
+            "updated": self.lastUpdate.isoformat() if self.lastUpdate else None,
+            "lists": {
+                key: {
+                    "fields": list(MATERIAL_CLASSES[key].fields),
+                    "rows": [
+                        list(material.asJSON().values()) for material in self.getList(key)
+                    ],
+                }
+                for key in MATERIAL_LISTS
+            },
+            "debtsAmount": self.user.debtsAmount,
+            "quotas": [
+                self.user.eBooks,
+                self.user.eBooksQuota,
+                self.user.audioBooks,
+                self.user.audioBooksQuota,
+            ],
+        }
+
+    # Restore a stored snapshot, served as stale until the next update
+    def setSnapshot(self, snapshot: dict) -> None:
+        lists = {}
+        for key in MATERIAL_LISTS:
+            stored = snapshot["lists"].get(key, {"fields": [], "rows": []})
+            lists[key] = [
+                MATERIAL_CLASSES[key].fromJSON(dict(zip(stored["fields"], row)))
+                for row in stored["rows"]
+            ]
+
+        self.user.loans = lists[LOANS]
+        self.user.loansOverdue = lists[LOANS_OVERDUE]
+        self.user.reservations = lists[RESERVATIONS]
+        self.user.reservationsReady = lists[RESERVATIONS_READY]
+        self.user.debts = lists[DEBTS]
+        self.user.debtsAmount = snapshot.get("debtsAmount", 0.0)
+        (
+            self.user.eBooks,
+            self.user.eBooksQuota,
+            self.user.audioBooks,
+            self.user.audioBooksQuota,
+        ) = snapshot.get("quotas", (0, 0, 0, 0))
+        if snapshot.get("updated"):
+            self.lastUpdate = datetime.fromisoformat(snapshot["updated"])
+        self.stale = True
+
+    # Restore a stored profile, the next update refreshes it when too old
+    def setProfile(self, profile: dict) -> None:
+        self.libraryName = profile.get("libraryName") or self.libraryName
+        self.icon = profile.get("icon") or self.icon
+        self.user.name = profile.get("name")
+        self.user.address = profile.get("address")
+        self.user.phone = profile.get("phone")
+        self.user.phoneNotify = profile.get("phoneNotify")
+        self.user.mail = profile.get("mail")
+        self.user.mailNotify = profile.get("mailNotify")
+        self.user.pickupLibrary = profile.get("pickupLibrary")
+        if profile.get("updated"):
+            self.profileUpdated = datetime.fromisoformat(profile["updated"])
+
     # Get the loans with all possible details
     def fetchLoans(self, soup=None) -> list:
-        # Fetch the loans page
+        tempList = list(self.iterLoans(soup))
+
+        if DEBUG:
+            _LOGGER.debug("%s has %s loans", self.user.name, len(tempList))
+
+        return tempList
+
+    # Iterate the loans, one material at the time
+    def iterLoans(self, soup=None):
+        # Fetch the loans page, and release it when done
         if not soup:
-            soup = self._fetchPage(self.host + URLS[LOANS])
+            soup = self._fetchPage(
+                self.host + URLS[LOANS], reader=paneReader(("div", DIVS[LOANS]))
+            )
+            yield from self._releasing(soup, self.iterLoans(soup))
+            return
 
         # From the <div> containing part of the class
         # for material in soup.select("div[class*='material-item']"):
-        tempList = []
         for material in self._getMaterials(soup.find("div", class_=DIVS[LOANS])):
             # Create an instance of libraryLoan
             obj = libraryLoan()
@@ -529,11 +1155,8 @@ class Library:
             # Renewable
             obj.renewId, obj.renewAble = self._getIdInfo(material)
 
-            # URL and image
-            obj.url, obj.coverUrl = self._getMaterialUrls(material)
-
-            # Type, title and creator
-            obj.title, obj.creators, obj.type = self._getMaterialInfo(material)
+            # URL, image, type, title and creator
+            obj.info = self._getMaterialRecord(material)
 
             # Details
             for keys, value in self._getDetails(material):
@@ -544,109 +1167,215 @@ class Library:
                 elif "material-number" in keys:
                     obj.id = value
 
-            # Add the loan to the stack
-            tempList.append(obj)
-
-        if DEBUG:
-            _LOGGER.debug("%s has %s loans", self.user.name, len(tempList))
+            yield obj
 
-        return tempList
+    # The overdue loans are the loans past their due date. The page of the
+    # overdue loans is only fetched once in a while, to check that still holds.
+    def fetchLoansOverdue(self, loans=None) -> list:
+        if loans is not None and self.deriveOverdue and not self._overdueCheckDue():
+            return self.deriveLoansOverdue(loans)
 
-    def fetchLoansOverdue(self) -> list:
         if DEBUG:
             _LOGGER.debug("%s, Reusing the fetchLoans function", self.user.name)
         # Fetch the loans overdue page
-        return self.fetchLoans(self._fetchPage(self.host + URLS[LOANS_OVERDUE]))
+        soup = self._fetchPage(
+            self.host + URLS[LOANS_OVERDUE],
+            reader=paneReader(("div", DIVS[LOANS_OVERDUE])),
+        )
+        loansOverdue = self.fetchLoans(soup)
+        soup.decompose()
+        self.overdueChecked = datetime.now()
+        if loans is None:
+            return loansOverdue
+
+        # Use the instances of the loans, they are the same materials
+        loansByKey = {loan.key: loan for loan in loans}
+        loansOverdue = [loansByKey.get(loan.key, loan) for loan in loansOverdue]
+
+        # Keep fetching the page until the due dates match it again
+        derived = {loan.key for loan in self.deriveLoansOverdue(loans)}
+        self.deriveOverdue = derived == {loan.key for loan in loansOverdue}
+        if not self.deriveOverdue:
+            _LOGGER.warning(
+                "(%s) The overdue loans (%s) does not match the due dates of the loans (%s), fetching the page",
+                self.user.userId[:-4],
+                len(loansOverdue),
+                len(derived),
+            )
+
+        return loansOverdue
+
+    def deriveLoansOverdue(self, loans: list) -> list:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return [loan for loan in loans if loan.expireDate and loan.expireDate < today]
 
     # Get the current reservations
     def fetchReservations(self, soup=None) -> list:
-        # Fecth the reservations page
+        tempList = list(self.iterReservations(soup))
+
+        if DEBUG:
+            _LOGGER.debug("%s has %s reservations", self.user.name, len(tempList))
+
+        return tempList
+
+    # Iterate the current reservations, one material at the time
+    def iterReservations(self, soup=None):
+        # Fecth the reservations page, and release it when done
         if not soup:
             soup = self._fetchPage(self.host + URLS[RESERVATIONS])
+            yield from self._releasing(soup, self.iterReservations(soup))
+            return
 
-        tempList = []
         # From the <div> with containg the class of the materials
         _LOGGER.debug("Number of divs (%s): (%d)",DIVS[RESERVATIONS],len(soup.select("."+DIVS[RESERVATIONS])))
         for material in self._getMaterials(soup.find_all("div", class_=DIVS[RESERVATIONS])[len(soup.select("."+DIVS[RESERVATIONS]))-1]):
-            # Create a instance of libraryReservation
-            obj = libraryReservation()
+            yield self._getReservation(material, self._getDetails(material))
 
-            # Get the first element (id)
-            obj.id = self._getIdInfo(material)[0]
+    def _getReservation(self, material, details) -> libraryReservation:
+        # Create a instance of libraryReservation
+        obj = libraryReservation()
 
-            # URL and image
-            obj.url, obj.coverUrl = self._getMaterialUrls(material)
+        # Get the first element (id)
+        obj.id = self._getIdInfo(material)[0]
 
-            # Type, title and creator
-            obj.title, obj.creators, obj.type = self._getMaterialInfo(material)
+        # URL, image, type, title and creator
+        obj.info = self._getMaterialRecord(material)
 
-            # Details
-            for keys, value in self._getDetails(material):
-                if "expire-date" in keys:
-                    obj.expireDate = self._getDatetime(value)
-                elif "created-date" in keys:
-                    obj.createdDate = self._getDatetime(value)
-                elif "queue-number" in keys:
-                    obj.queueNumber = value
-                elif "pickup-branch" in keys:
-                    obj.pickupLibrary = value
+        # Details
+        for keys, value in details:
+            if "expire-date" in keys:
+                obj.expireDate = self._getDatetime(value)
+            elif "created-date" in keys:
+                obj.createdDate = self._getDatetime(value)
+            elif "queue-number" in keys:
+                obj.queueNumber = value
+            elif "pickup-branch" in keys:
+                obj.pickupLibrary = value
 
-            # Add the reservation to the stack
-            tempList.append(obj)
+        return obj
+
+    # Get the reservations which are ready
+    def fetchReservationsReady(self, soup=None) -> list:
+        tempList = list(self.iterReservationsReady(soup))
 
         if DEBUG:
-            _LOGGER.debug("%s has %s reservations", self.user.name, len(tempList))
+            _LOGGER.debug(
+                "%s has %s reservations ready for pickup", self.user.name, len(tempList)
+            )
 
         return tempList
 
-    # Get the reservations which are ready
-    def fetchReservationsReady(self, soup=None) -> list:
+    # Iterate the reservations which are ready, one material at the time
+    def iterReservationsReady(self, soup=None):
         # Fecth the ready reservationsReady page
         if not soup:
-            soup = self._fetchPage(self.host + URLS[RESERVATIONS_READY])
+            soup = self._fetchPage(
+                self.host + URLS[RESERVATIONS_READY],
+                reader=paneReader(("div", DIVS[RESERVATIONS_READY])),
+            )
+            yield from self._releasing(soup, self.iterReservationsReady(soup))
+            return
 
-        tempList = []
         # From the <div> with the materials
         for material in self._getMaterials(soup.find("div", class_=DIVS[RESERVATIONS_READY])):
-            # Create a instance of libraryReservationReady
-            obj = libraryReservationReady()
+            yield self._getReservationReady(material, self._getDetails(material))
+
+    def _getReservationReady(self, material, details) -> libraryReservationReady:
+        # Create a instance of libraryReservationReady
+        obj = libraryReservationReady()
+
+        # Get the first element (id)
+        obj.id = self._getIdInfo(material)[0]
+
+        # URL, image, type, title and creator
+        obj.info = self._getMaterialRecord(material)
+
+        # Details
+        for keys, value in details:
+            if "pickup-id" in keys:
+                obj.reservationNumber = value
+            elif "pickup-date" in keys:
+                obj.pickupDate = self._getDatetime(value)
+            elif "created-date" in keys:
+                obj.createdDate = self._getDatetime(value)
+            elif "pickup-branch" in keys:
+                obj.pickupLibrary = value
+
+        return obj
+
+    # Get the current and the ready reservations from a single page.
+    # The reservations page holds a pane for each, so every material of
+    # every pane is sorted in one walk. As on the pages of their own, the
+    # last pane holds the current reservations and the panes before it the
+    # ready ones, which eReolen lists without any pickup details.
+    def fetchAllReservations(self, soup=None) -> tuple:
+        if not RESERVATIONS_SINGLE_PAGE:
+            return self.fetchReservations(soup), self.fetchReservationsReady(soup)
+
+        # Fecth the reservations page, and release it when done
+        if not soup:
+            soup = self._fetchPage(self.host + URLS[RESERVATIONS])
+            result = self.fetchAllReservations(soup)
+            soup.decompose()
+            return result
+
+        reservations, reservationsReady = [], []
+        panes = soup.find_all("div", class_=DIVS[RESERVATIONS])
+        for index, pane in enumerate(panes):
+            readyPane = index < len(panes) - 1
+            for material in self._getMaterials(pane):
+                details = list(self._getDetails(material))
+                if readyPane or any(
+                    ready in keys for keys, _ in details for ready in READY_DETAILS
+                ):
+                    reservationsReady.append(self._getReservationReady(material, details))
+                else:
+                    reservations.append(self._getReservation(material, details))
 
-            # Get the first element (id)
-            obj.id = self._getIdInfo(material)[0]
+        if DEBUG:
+            _LOGGER.debug(
+                "%s has %s reservations, %s ready for pickup",
+                self.user.name,
+                len(reservations),
+                len(reservationsReady),
+            )
 
-            # URL and image
-            obj.url, obj.coverUrl = self._getMaterialUrls(material)
+        return reservations, reservationsReady
 
-            # Type, title and creator
-            obj.title, obj.creators, obj.type = self._getMaterialInfo(material)
+    # Get debts, if any, from the Library
+    def fetchDebts(self) -> tuple:
+        # Fetch the debts page
+        soup = self._fetchPage(
+            self.host + URLS[DEBTS],
+            reader=paneReader(("div", DIVS[DEBTS]), ("span", "amount")),
+        )
 
-            # Details
-            for keys, value in self._getDetails(material):
-                if "pickup-id" in keys:
-                    obj.reservationNumber = value
-                elif "pickup-date" in keys:
-                    obj.pickupDate = self._getDatetime(value)
-                elif "created-date" in keys:
-                    obj.createdDate = self._getDatetime(value)
-                elif "pickup-branch" in keys:
-                    obj.pickupLibrary = value
-
-            # Add the reservation to the stack
-            tempList.append(obj)
+        tempList = list(self.iterDebts(soup))
+
+        try:
+            amount = soup.select_one("span[class='amount']")
+            amount = self._removeCurrency(self._text(amount)) if amount else 0.0
+        except (AttributeError, KeyError) as err:
+            _LOGGER.error("Error processing the debt amount. Error: (%s)", err)
+        soup.decompose()
 
         if DEBUG:
             _LOGGER.debug(
-                "%s has %s reservations ready for pickup", self.user.name, len(tempList)
+                "%s has %s debts with a total of {amount}",
+                self.user.name,
+                len(tempList),
             )
 
-        return tempList
+        return tempList, amount
 
-    # Get debts, if any, from the Library
-    def fetchDebts(self) -> tuple:
-        # Fetch the debts page
-        soup = self._fetchPage(self.host + URLS[DEBTS])
+    # Iterate the debts, one material at the time
+    def iterDebts(self, soup=None):
+        # Fetch the debts page, and release it when done
+        if not soup:
+            soup = self._fetchPage(self.host + URLS[DEBTS])
+            yield from self._releasing(soup, self.iterDebts(soup))
+            return
 
-        tempList = []
         # From the <div> with containg the class of the materials
         for material in self._getMaterials(soup):
             obj = libraryDebt()
@@ -654,11 +1383,8 @@ class Library:
             # Get the first element (id)
             # obj.id = self._getIdInfo(material)[0] # This actuallly serves no purpose for debts
 
-            # URL and image
-            obj.url, obj.coverUrl = self._getMaterialUrls(material)
-
-            # Type, title and creator
-            obj.title, obj.creators, obj.type = self._getMaterialInfo(material)
+            # URL, image, type, title and creator
+            obj.info = self._getMaterialRecord(material)
 
             # Details
             for keys, value in self._getDetails(material):
@@ -669,58 +1395,189 @@ class Library:
                 elif "fee_amount" in keys:
                     obj.feeAmount = self._removeCurrency(value)
 
-            tempList.append(obj)
+            yield obj
 
-        try:
-            amount = soup.select_one("span[class='amount']")
-            amount = self._removeCurrency(amount.string) if amount else 0.0
-        except (AttributeError, KeyError) as err:
-            _LOGGER.error("Error processing the debt amount. Error: (%s)", err)
-
-        if DEBUG:
-            _LOGGER.debug(
-                "%s has %s debts with a total of {amount}",
-                self.user.name,
-                len(tempList),
-            )
-
-        return tempList, amount
+    # Iterate one of the lists of materials on the user
+    def iterMaterials(self, key, start=0, stop=None):
+        return itertools.islice(self.getList(key), start, stop)
 
 
 class libraryUser:
-    userInfo = None
-    name, address = None, None
-    phone, phoneNotify, mail, mailNotify = None, None, None, None
-    loans, loansOverdue, reservations, reservationsReady, debts = [], [], [], [], []
-    debtsAmount = 0.0
-    eBooks, eBooksQuota, audioBooks, audioBooksQuota = 0, 0, 0, 0
-    pickupLibrary = None
-
     def __init__(self, userId: str, pincode: str) -> None:
         self.userInfo = {"loginBibDkUserId": userId, "pincode": pincode}
         self.userId = userId
+        self.name, self.address = None, None
+        self.phone, self.phoneNotify, self.mail, self.mailNotify = None, None, None, None
+        # Every user has lists of its own
+        self.loans, self.loansOverdue, self.debts = [], [], []
+        self.reservations, self.reservationsReady = [], []
+        self.debtsAmount = 0.0
+        self.eBooks, self.eBooksQuota, self.audioBooks, self.audioBooksQuota = 0, 0, 0, 0
+        self.pickupLibrary = None
 
 
 class libraryMaterial:
     id = None
-    type, title, creators = None, None, None
-    url, coverUrl = None, None
+    info = materialInfo(None, None, None, None, None)
+
+    # The metadata is read from the shared record
+    url = property(attrgetter("info.url"))
+    coverUrl = property(attrgetter("info.coverUrl"))
+    type = property(attrgetter("info.type"))
+    title = property(attrgetter("info.title"))
+    creators = property(attrgetter("info.creators"))
+
+    # The attribute holding the stable id, and all the attributes
+    keyField = "id"
+    fields = ("id", "type", "title", "creators", "url", "coverUrl")
+
+    sortKey = None
+
+    # The stable id, fall back to the url if the library has none
+    @property
+    def key(self):
+        return getattr(self, self.keyField) or self.url
+
+    # Built only once, a material is not changed after it has been parsed
+    def buildSortKey(self) -> None:
+        self.sortKey = self._getSortKey()
+
+    def _getSortKey(self) -> tuple:
+        return (self.title is None, self.title)
+
+    def asDict(self) -> dict:
+        return {field: getattr(self, field) for field in self.fields}
+
+    # As plain values, with the dates in ISO format
+    def asJSON(self) -> dict:
+        return {
+            field: value.isoformat() if isinstance(value, datetime) else value
+            for field, value in self.asDict().items()
+        }
+
+    # Rebuild a material from asJSON, the metadata goes into the shared record
+    @classmethod
+    def fromJSON(cls, data: dict) -> libraryMaterial:
+        obj = cls()
+        obj.info = internMaterialInfo(*(data.get(field) for field in INFO_FIELDS))
+        for field in cls.fields:
+            if field in INFO_FIELDS:
+                continue
+            value = data.get(field)
+            if field in DATE_FIELDS and value:
+                value = datetime.fromisoformat(value)
+            setattr(obj, field, value)
+        obj.buildSortKey()
+        return obj
+
+    def sameAs(self, other) -> bool:
+        for field in self.fields:
+            if getattr(self, field) != getattr(other, field):
+                return False
+        return True
 
 
 class libraryLoan(libraryMaterial):
     loanDate, expireDate = None, None
     renewId, renewAble = None, None
 
+    keyField = "renewId"
+    fields = libraryMaterial.fields + ("loanDate", "expireDate", "renewId", "renewAble")
+
+    # By expireDate and the title
+    def _getSortKey(self) -> tuple:
+        return (self.expireDate is None, self.expireDate, self.title)
+
 
 class libraryReservation(libraryMaterial):
     createdDate, expireDate, queueNumber = None, None, None
     pickupLibrary = None
 
+    fields = libraryMaterial.fields + (
+        "createdDate",
+        "expireDate",
+        "queueNumber",
+        "pickupLibrary",
+    )
+
+    # By queueNumber, createdDate and the title
+    # The queue number is text on the page, compare it as a number so "4" comes before "12"
+    def _getSortKey(self) -> tuple:
+        queueNumber = int(self.queueNumber) if str(self.queueNumber).isdigit() else None
+        return (
+            queueNumber is None,
+            queueNumber,
+            self.createdDate is None,
+            self.createdDate,
+            self.title,
+        )
+
 
 class libraryReservationReady(libraryMaterial):
     createdDate, pickupDate, reservationNumber = None, None, None
     pickupLibrary = None
 
+    keyField = "reservationNumber"
+    fields = libraryMaterial.fields + (
+        "createdDate",
+        "pickupDate",
+        "reservationNumber",
+        "pickupLibrary",
+    )
+
+    # By pickupDate and the title
+    def _getSortKey(self) -> tuple:
+        return (self.pickupDate is None, self.pickupDate, self.title)
+
 
 class libraryDebt(libraryMaterial):
     feeDate, feeType, feeAmount = None, None, None
+
+    fields = libraryMaterial.fields + ("feeDate", "feeType", "feeAmount")
+
+    # Debts have no id, and several can be for the same material
+    @property
+    def key(self):
+        return (self.url, self.feeDate, self.feeType)
+
+
+#### THE CLASS OF THE MATERIALS OF EVERY LIST
+MATERIAL_CLASSES = {
+    LOANS: libraryLoan,
+    LOANS_OVERDUE: libraryLoan,
+    RESERVATIONS: libraryReservation,
+    RESERVATIONS_READY: libraryReservationReady,
+    DEBTS: libraryDebt,
+}
+
+
+# Compare two snapshots of a list of materials by their stable ids
+# Returns the added, the removed and the changed materials, where a
+# change is the material and a dict of {field: (old, new)}
+# The unchanged materials in new are swapped for their old instance
+def diffMaterials(old: list, new: list) -> tuple:
+    # Two materials can share a key, e.g. two copies of the same title,
+    # so each key holds its materials in the order they were listed
+    oldByKey = {}
+    for material in old:
+        oldByKey.setdefault(material.key, deque()).append(material)
+    added, changed = [], []
+    for index, material in enumerate(new):
+        same = oldByKey.get(material.key)
+        previous = same.popleft() if same else None
+        if previous is None:
+            added.append(material)
+        elif previous.sameAs(material):
+            new[index] = previous
+        else:
+            fields = {
+                field: (getattr(previous, field), getattr(material, field))
+                for field in material.fields
+                if getattr(previous, field) != getattr(material, field)
+            }
+            changed.append((material, fields))
+    # What is left is gone
+    removed = [material for same in oldByKey.values() for material in same]
+
+    return added, removed, changed
+
@@ -0,0 +1,103 @@
+"""Offline reverse geocoding of the Danish municipalities."""
+from __future__ import annotations
+
+from functools import lru_cache
+
+import json
+import logging
+import math
+import os
+
+BOUNDARIES_FILE = os.path.join(os.path.dirname(__file__), "municipalities.json")
+BOUNDARIES_VERSION = 1
+# Size of a cell in the grid, in degrees
+GRID_SIZE = 0.1
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class municipalityResolver:
+    """Point in polygon over simplified boundaries, indexed by a grid.
+
+    Every cell of the grid holds the municipalities whose bounding box
+    overlaps it, so a lookup only tests the few polygons near the point.
+    The rings of a municipality are tested together with the even-odd
+    rule, which covers both islands and holes.
+    """
+
+    def __init__(self, municipalities: list) -> None:
+        self.municipalities, self.grid = [], {}
+        for municipality in municipalities:
+            rings = [
+                [(float(lon), float(lat)) for lon, lat in ring]
+                for ring in municipality["rings"]
+                if len(ring) > 2
+            ]
+            if not rings:
+                continue
+
+            lons = [lon for ring in rings for lon, _ in ring]
+            lats = [lat for ring in rings for _, lat in ring]
+            bbox = (min(lons), min(lats), max(lons), max(lats))
+            self.municipalities.append((municipality["name"], bbox, rings))
+
+            index = len(self.municipalities) - 1
+            for x in range(self._cell(bbox[0]), self._cell(bbox[2]) + 1):
+                for y in range(self._cell(bbox[1]), self._cell(bbox[3]) + 1):
+                    self.grid.setdefault((x, y), []).append(index)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / GRID_SIZE)
+
+    def _inRings(self, lon: float, lat: float, rings: list) -> bool:
+        inside = False
+        for ring in rings:
+            x1, y1 = ring[-1]
+            for x2, y2 in ring:
+                if (y1 > lat) != (y2 > lat) and lon < (x1 - x2) * (lat - y2) / (
+                    y1 - y2
+                ) + x2:
+                    inside = not inside
+                x1, y1 = x2, y2
+        return inside
+
+    # Return the name of the municipality covering the point, if any
+    def resolve(self, lon: float, lat: float) -> str | None:
+        for index in self.grid.get((self._cell(lon), self._cell(lat)), []):
+            name, bbox, rings = self.municipalities[index]
+            if not (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+                continue
+            if self._inRings(lon, lat, rings):
+                return name
+        return None
+
+
+# Load the boundaries bundled with the integration, only once
+@lru_cache(maxsize=1)
+def loadResolver() -> municipalityResolver:
+    try:
+        with open(BOUNDARIES_FILE, encoding="utf-8") as file:
+            boundaries = json.load(file)
+    except FileNotFoundError:
+        # Only bundled in releases, made by scripts/generate_municipalities.py
+        _LOGGER.debug("No bundled municipalities (%s)", BOUNDARIES_FILE)
+        return municipalityResolver([])
+    except (OSError, ValueError) as err:
+        _LOGGER.error(
+            "Error loading the bundled municipalities (%s): %s", BOUNDARIES_FILE, err
+        )
+        return municipalityResolver([])
+
+    if boundaries.get("version") != BOUNDARIES_VERSION:
+        _LOGGER.error(
+            "The bundled municipalities has version %s, expected %s",
+            boundaries.get("version"),
+            BOUNDARIES_VERSION,
+        )
+        return municipalityResolver([])
+
+    return municipalityResolver(boundaries["municipalities"])
+
+
+def municipalityFromCoor(lon, lat) -> str | None:
+    return loadResolver().resolve(float(lon), float(lat))
@@ -4,22 +4,27 @@ import logging
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.components.sensor import SensorEntity
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
 
 from datetime import timedelta, datetime
-import asyncio
-import random
 import hashlib
+from urllib.parse import urljoin
 
 from .const import (
+    CONF_MAX_MATERIALS,
     CONF_UPDATE_INTERVAL,
     CREDITS,
     DOMAIN,
     CONF_SHOW_LOANS,
     CONF_SHOW_DEBTS,
     CONF_SHOW_RESERVATIONS,
+    MAX_MATERIALS,
+    SIGNAL_CHANGED,
+    STARTUP_STAGGER,
 )
 from homeassistant.const import (
     ATTR_ATTRIBUTION,
@@ -27,7 +32,11 @@ from homeassistant.const import (
     ATTR_ENTITY_PICTURE,
 )
 
+from . import async_run_update
+from .covers import coverUrl, spriteUrl
+from .events import changeEvents
 from .library_api import Library, libraryUser
+from .storage import DATA_STORES
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 _LOGGER = logging.getLogger(__name__)
@@ -40,22 +49,17 @@ async def async_setup_entry(
     # Define a update function
     async def async_update_data():
 
-        # Only run one instance at a time...
-        if DOMAIN in hass.data:
-            while any(
-                libraryObj.running == True for libraryObj in hass.data[DOMAIN].values()
-            ):
-                waitTime = random.randint(5, 10)
-                _LOGGER.debug(
-                    "Instance of Library already running, waiting %s seconds before next probing",
-                    waitTime,
-                )
-                await asyncio.sleep(waitTime)
-
         # Retrieve the client stored in the hass data stack
         myLibrary = hass.data[DOMAIN][entry.entry_id]
-        # Call, and wait for it to finish, the function with the refresh procedure
-        await hass.async_add_executor_job(myLibrary.update)
+        # Call, and wait for it to finish, the function with the refresh procedure.
+        changes = await async_run_update(hass, myLibrary)
+        # Keep the profile and the lists for the next start
+        store = hass.data[DATA_STORES][entry.entry_id]
+        await store.async_save_profile(myLibrary.getProfile())
+        await store.async_save_snapshot(myLibrary.getSnapshot())
+        # Tell what has changed since the last update
+        fireChangeEvents(hass, entry, myLibrary, changes)
+        async_dispatcher_send(hass, SIGNAL_CHANGED.format(entry.entry_id), changes)
 
     # Create a coordinator
     coordinator = DataUpdateCoordinator(
@@ -66,32 +70,53 @@ async def async_setup_entry(
         update_interval=timedelta(minutes=int(entry.data[CONF_UPDATE_INTERVAL])),
     )
 
-    # Immediate refresh
-    await coordinator.async_request_refresh()
+    myLibrary = hass.data[DOMAIN][entry.entry_id]
+
+    # The profile is known, either stored or from the first update at the
+    # setup of the entry. Refresh in the background, staggered so the
+    # accounts do not all start at once.
+    delay = STARTUP_STAGGER * hass.config_entries.async_entries(DOMAIN).index(entry)
+
+    @callback
+    def async_first_refresh(_now) -> None:
+        hass.async_create_task(coordinator.async_refresh())
+
+    entry.async_on_unload(async_call_later(hass, delay, async_first_refresh))
+
+    # Only the most urgent materials goes into the attributes
+    maxMaterials = entry.data.get(CONF_MAX_MATERIALS, MAX_MATERIALS)
 
     sensors = []
 
     # Library
-    myLibrary = hass.data[DOMAIN][entry.entry_id]
     sensors.append(LibrarySensor(myLibrary, coordinator))
 
     # Loans
     if entry.data[CONF_SHOW_LOANS]:
-        sensors.append(LoanSensor(myLibrary.user, coordinator))
-        sensors.append(LoanOverdueSensor(myLibrary.user, coordinator))
+        sensors.append(LoanSensor(myLibrary.user, coordinator, maxMaterials))
+        sensors.append(LoanOverdueSensor(myLibrary.user, coordinator, maxMaterials))
 
     # Debts
     if entry.data[CONF_SHOW_DEBTS]:
-        sensors.append(DebtSensor(myLibrary.user, coordinator))
+        sensors.append(DebtSensor(myLibrary.user, coordinator, maxMaterials))
 
     # Reservations
     if entry.data[CONF_SHOW_RESERVATIONS]:
-        sensors.append(ReservationSensor(myLibrary.user, coordinator))
-        sensors.append(ReservationReadySensor(myLibrary.user, coordinator))
+        sensors.append(ReservationSensor(myLibrary.user, coordinator, maxMaterials))
+        sensors.append(ReservationReadySensor(myLibrary.user, coordinator, maxMaterials))
 
     async_add_entities(sensors)
 
 
+@callback
+def fireChangeEvents(
+    hass: HomeAssistant, entry: ConfigEntry, myLibrary: Library, changes: dict
+):
+    data = {"entry_id": entry.entry_id, "user": myLibrary.user.name}
+    for eventType, eventData in changeEvents(changes, data):
+        hass.bus.async_fire(eventType, eventData)
+
+
 def md5_unique_id(string):
     return hashlib.md5(string.encode("utf-8")).hexdigest()
 
@@ -141,6 +166,8 @@ class LibrarySensor(SensorEntity):
             "mail": self.myLibrary.user.mail,
             "mail_notifications": self.myLibrary.user.mailNotify,
             "pickup_library": self.myLibrary.user.pickupLibrary,
+            "updated": self.myLibrary.lastUpdate,
+            "stale": self.myLibrary.stale,
             "sensor_type": "main",
             ATTR_UNIT_OF_MEASUREMENT: "days",
             ATTR_ATTRIBUTION: CREDITS,
@@ -156,9 +183,15 @@ class LibrarySensor(SensorEntity):
                 }
             )
 
-        # PNG as icon/entity-picture
+        # PNG as icon/entity-picture, served from the cache
         if self.myLibrary.icon:
-            attr.update({ATTR_ENTITY_PICTURE: self.myLibrary.icon})
+            attr.update(
+                {
+                    ATTR_ENTITY_PICTURE: coverUrl(
+                        self.hass, urljoin(self.myLibrary.host, self.myLibrary.icon)
+                    )
+                }
+            )
 
         return attr
 
@@ -188,13 +221,18 @@ class LibrarySensor(SensorEntity):
 
 
 class LoanSensor(SensorEntity):
+    # The list is large and served by the service and the websocket API
+    _unrecorded_attributes = frozenset({"loans", "sprite"})
+
     def __init__(
         self,
         libraryUser: libraryUser,
         coordinator: DataUpdateCoordinator,
+        maxMaterials: int,
     ) -> None:
         self.libraryUser = libraryUser
         self.coordinator = coordinator
+        self.maxMaterials = maxMaterials
         self._name = f"Bibliotekslån ({self.libraryUser.name})"
         self._unique_id = md5_unique_id("Loans_" + self.libraryUser.userId)
 
@@ -220,7 +258,7 @@ class LoanSensor(SensorEntity):
     def extra_state_attributes(self):
         attr = {"user": self.libraryUser.name}
         loans = []
-        for loan in self.libraryUser.loans:
+        for loan in self.libraryUser.loans[: self.maxMaterials]:
             loans.append(
                 {
                     "title": loan.title,
@@ -230,10 +268,20 @@ class LoanSensor(SensorEntity):
                     "expire_date": loan.expireDate,
                     "renewable": loan.renewAble,
                     "url": loan.url,
-                    "cover": loan.coverUrl,
+                    "cover": coverUrl(self.hass, loan.coverUrl),
                 }
             )
         attr["loans"] = loans
+        # The covers of the materials above, packed into one image
+        attr["sprite"] = spriteUrl(
+            self.hass,
+            [material.coverUrl for material in self.libraryUser.loans[: self.maxMaterials]],
+        )
+        # Compact summary, the list is not recorded
+        attr["next_expire_date"] = (
+            self.libraryUser.loans[0].expireDate if self.libraryUser.loans else None
+        )
+        attr["renewable"] = sum(loan.renewAble is True for loan in self.libraryUser.loans)
         attr[ATTR_ATTRIBUTION] = CREDITS
         return attr
 
@@ -263,13 +311,18 @@ class LoanSensor(SensorEntity):
 
 
 class LoanOverdueSensor(SensorEntity):
+    # The list is large and served by the service and the websocket API
+    _unrecorded_attributes = frozenset({"loans_overdue", "sprite"})
+
     def __init__(
         self,
         libraryUser: libraryUser,
         coordinator: DataUpdateCoordinator,
+        maxMaterials: int,
     ) -> None:
         self.libraryUser = libraryUser
         self.coordinator = coordinator
+        self.maxMaterials = maxMaterials
         self._name = f"Bibliotekslån overskredet ({self.libraryUser.name})"
         self._unique_id = md5_unique_id("LoansOverdue_" + self.libraryUser.userId)
 
@@ -295,7 +348,7 @@ class LoanOverdueSensor(SensorEntity):
     def extra_state_attributes(self):
         attr = {"user": self.libraryUser.name}
         loans_overdue = []
-        for loan_overdue in self.libraryUser.loansOverdue:
+        for loan_overdue in self.libraryUser.loansOverdue[: self.maxMaterials]:
             loans_overdue.append(
                 {
                     "title": loan_overdue.title,
@@ -304,10 +357,21 @@ class LoanOverdueSensor(SensorEntity):
                     "loan_date": loan_overdue.loanDate,
                     "expire_date": loan_overdue.expireDate,
                     "url": loan_overdue.url,
-                    "cover": loan_overdue.coverUrl,
+                    "cover": coverUrl(self.hass, loan_overdue.coverUrl),
                 }
             )
         attr["loans_overdue"] = loans_overdue
+        # The covers of the materials above, packed into one image
+        attr["sprite"] = spriteUrl(
+            self.hass,
+            [material.coverUrl for material in self.libraryUser.loansOverdue[: self.maxMaterials]],
+        )
+        # Compact summary, the list is not recorded
+        attr["oldest_expire_date"] = (
+            self.libraryUser.loansOverdue[0].expireDate
+            if self.libraryUser.loansOverdue
+            else None
+        )
         attr[ATTR_ATTRIBUTION] = CREDITS
         return attr
 
@@ -337,13 +401,18 @@ class LoanOverdueSensor(SensorEntity):
 
 
 class ReservationSensor(SensorEntity):
+    # The list is large and served by the service and the websocket API
+    _unrecorded_attributes = frozenset({"reservations", "sprite"})
+
     def __init__(
         self,
         libraryUser: libraryUser,
         coordinator: DataUpdateCoordinator,
+        maxMaterials: int,
     ) -> None:
         self.libraryUser = libraryUser
         self.coordinator = coordinator
+        self.maxMaterials = maxMaterials
         self._name = f"Reservationer ({self.libraryUser.name})"
         self._unique_id = md5_unique_id("Reservations_" + self.libraryUser.userId)
 
@@ -369,7 +438,7 @@ class ReservationSensor(SensorEntity):
     def extra_state_attributes(self):
         attr = {"user": self.libraryUser.name}
         reservations = []
-        for reservation in self.libraryUser.reservations:
+        for reservation in self.libraryUser.reservations[: self.maxMaterials]:
             reservations.append(
                 {
                     "title": reservation.title,
@@ -380,10 +449,21 @@ class ReservationSensor(SensorEntity):
                     "expire_date": reservation.expireDate,
                     "pickup_library": reservation.pickupLibrary,
                     "url": reservation.url,
-                    "cover": reservation.coverUrl,
+                    "cover": coverUrl(self.hass, reservation.coverUrl),
                 }
             )
         attr["reservations"] = reservations
+        # The covers of the materials above, packed into one image
+        attr["sprite"] = spriteUrl(
+            self.hass,
+            [material.coverUrl for material in self.libraryUser.reservations[: self.maxMaterials]],
+        )
+        # Compact summary, the list is not recorded
+        attr["next_queue_number"] = (
+            self.libraryUser.reservations[0].queueNumber
+            if self.libraryUser.reservations
+            else None
+        )
         attr[ATTR_ATTRIBUTION] = CREDITS
         return attr
 
@@ -413,13 +493,18 @@ class ReservationSensor(SensorEntity):
 
 
 class ReservationReadySensor(SensorEntity):
+    # The list is large and served by the service and the websocket API
+    _unrecorded_attributes = frozenset({"reservations_ready", "sprite"})
+
     def __init__(
         self,
         libraryUser: libraryUser,
         coordinator: DataUpdateCoordinator,
+        maxMaterials: int,
     ) -> None:
         self.libraryUser = libraryUser
         self.coordinator = coordinator
+        self.maxMaterials = maxMaterials
         self._name = f"Reservationer klar ({self.libraryUser.name})"
         self._unique_id = md5_unique_id("ReservationsReady_" + self.libraryUser.userId)
 
@@ -445,7 +530,7 @@ class ReservationReadySensor(SensorEntity):
     def extra_state_attributes(self):
         attr = {"user": self.libraryUser.name}
         reservationsReady = []
-        for reservationReady in self.libraryUser.reservationsReady:
+        for reservationReady in self.libraryUser.reservationsReady[: self.maxMaterials]:
             reservationsReady.append(
                 {
                     "title": reservationReady.title,
@@ -456,10 +541,21 @@ class ReservationReadySensor(SensorEntity):
                     "pickup_date": reservationReady.pickupDate,
                     "pickup_library": reservationReady.pickupLibrary,
                     "url": reservationReady.url,
-                    "cover": reservationReady.coverUrl,
+                    "cover": coverUrl(self.hass, reservationReady.coverUrl),
                 }
             )
         attr["reservations_ready"] = reservationsReady
+        # The covers of the materials above, packed into one image
+        attr["sprite"] = spriteUrl(
+            self.hass,
+            [material.coverUrl for material in self.libraryUser.reservationsReady[: self.maxMaterials]],
+        )
+        # Compact summary, the list is not recorded
+        attr["next_pickup_date"] = (
+            self.libraryUser.reservationsReady[0].pickupDate
+            if self.libraryUser.reservationsReady
+            else None
+        )
         attr[ATTR_ATTRIBUTION] = CREDITS
         return attr
 
@@ -489,13 +585,18 @@ class ReservationReadySensor(SensorEntity):
 
 
 class DebtSensor(SensorEntity):
+    # The list is large and served by the service and the websocket API
+    _unrecorded_attributes = frozenset({"debts", "sprite"})
+
     def __init__(
         self,
         libraryUser: libraryUser,
         coordinator: DataUpdateCoordinator,
+        maxMaterials: int,
     ) -> None:
         self.libraryUser = libraryUser
         self.coordinator = coordinator
+        self.maxMaterials = maxMaterials
         self._name = f"Gebyrer ({self.libraryUser.name})"
         self._unique_id = md5_unique_id("Debts_" + self.libraryUser.userId)
 
@@ -521,7 +622,7 @@ class DebtSensor(SensorEntity):
     def extra_state_attributes(self):
         attr = {"user": self.libraryUser.name}
         debts = []
-        for debt in self.libraryUser.debts:
+        for debt in self.libraryUser.debts[: self.maxMaterials]:
             debts.append(
                 {
                     "title": debt.title,
@@ -530,10 +631,17 @@ class DebtSensor(SensorEntity):
                     "fee_type": debt.feeType,
                     "fee_amount": debt.feeAmount,
                     "url": debt.url,
-                    "cover": debt.coverUrl,
+                    "cover": coverUrl(self.hass, debt.coverUrl),
                 }
             )
         attr["debts"] = debts
+        # The covers of the materials above, packed into one image
+        attr["sprite"] = spriteUrl(
+            self.hass,
+            [material.coverUrl for material in self.libraryUser.debts[: self.maxMaterials]],
+        )
+        # Compact summary, the list is not recorded
+        attr["count"] = len(self.libraryUser.debts)
         attr[ATTR_ATTRIBUTION] = CREDITS
         return attr
 
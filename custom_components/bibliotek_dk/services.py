@@ -0,0 +1,69 @@
+"""Services for Bibliotek."""
+from __future__ import annotations
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError
+
+import voluptuous as vol
+
+from .const import DOMAIN, SERVICE_GET_MATERIALS
+from .library_api import MATERIAL_LISTS
+
+ATTR_ENTRY_ID = "entry_id"
+ATTR_LIST = "list"
+ATTR_LIMIT = "limit"
+ATTR_OFFSET = "offset"
+
+# The name of the lists, as in the events, ex. "reservations_ready"
+LISTS = {key.lower(): key for key in MATERIAL_LISTS}
+
+GET_MATERIALS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ENTRY_ID): str,
+        vol.Required(ATTR_LIST): vol.In(list(LISTS)),
+        vol.Optional(ATTR_OFFSET, default=0): vol.All(int, vol.Range(min=0)),
+        vol.Optional(ATTR_LIMIT): vol.All(int, vol.Range(min=1)),
+    }
+)
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    if hass.services.has_service(DOMAIN, SERVICE_GET_MATERIALS):
+        return
+
+    # Return the full list of materials, the sensors only holds the first ones
+    async def async_get_materials(call: ServiceCall) -> ServiceResponse:
+        entryId = call.data.get(ATTR_ENTRY_ID)
+        if entryId and entryId not in hass.data[DOMAIN]:
+            raise HomeAssistantError(f"Unknown config entry: {entryId}")
+
+        key = LISTS[call.data[ATTR_LIST]]
+        start = call.data[ATTR_OFFSET]
+        stop = start + call.data[ATTR_LIMIT] if ATTR_LIMIT in call.data else None
+
+        response = {}
+        for libraryId, myLibrary in hass.data[DOMAIN].items():
+            if entryId and libraryId != entryId:
+                continue
+            response[libraryId] = {
+                "user": myLibrary.user.name,
+                "materials": [
+                    material.asJSON()
+                    for material in myLibrary.iterMaterials(key, start, stop)
+                ],
+            }
+
+        return response
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_MATERIALS,
+        async_get_materials,
+        schema=GET_MATERIALS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
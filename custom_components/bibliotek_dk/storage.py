@@ -0,0 +1,48 @@
+"""Per entry storage of the data scraped from the library."""
+from __future__ import annotations
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+DATA_STORES = f"{DOMAIN}_stores"
+STORAGE_VERSION = 1
+
+
+class libraryStore:
+    """The stored data of a single config entry."""
+
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry_id}")
+        self.data = {}
+
+    async def async_load(self) -> dict:
+        self.data = await self._store.async_load() or {}
+        return self.data
+
+    @property
+    def profile(self) -> dict:
+        return self.data.get("profile", {})
+
+    # Only write the profile when it actually has been refreshed
+    async def async_save_profile(self, profile: dict) -> None:
+        if profile["updated"] and profile != self.profile:
+            self.data["profile"] = profile
+            await self._store.async_save(self.data)
+
+    # The lists of the last successful update
+    @property
+    def snapshot(self) -> dict:
+        return self.data.get("snapshot", {})
+
+    # Only write the snapshot when the lists have changed, not for every update
+    async def async_save_snapshot(self, snapshot: dict) -> None:
+        if snapshot["updated"] and dict(snapshot, updated=None) != dict(
+            self.snapshot, updated=None
+        ):
+            self.data["snapshot"] = snapshot
+            await self._store.async_save(self.data)
+
+    async def async_remove(self) -> None:
+        await self._store.async_remove()
@@ -0,0 +1,101 @@
+"""Websocket API for streaming the materials to the dashboard."""
+from __future__ import annotations
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+import voluptuous as vol
+
+from .const import DOMAIN, SIGNAL_CHANGED
+from .services import LISTS
+
+DATA_WEBSOCKET = f"{DOMAIN}_websocket"
+
+
+@callback
+def async_setup_websocket(hass: HomeAssistant) -> None:
+    if DATA_WEBSOCKET in hass.data:
+        return
+    hass.data[DATA_WEBSOCKET] = True
+
+    websocket_api.async_register_command(hass, websocket_get_materials)
+    websocket_api.async_register_command(hass, websocket_subscribe_materials)
+
+
+# The key is used to match the changes with the materials already sent
+def _materialToJSON(material) -> dict:
+    return {"key": material.key, **material.asJSON()}
+
+
+def _getLibrary(hass: HomeAssistant, connection, msg):
+    if (myLibrary := hass.data[DOMAIN].get(msg["entry_id"])) is None:
+        connection.send_error(
+            msg["id"], websocket_api.ERR_NOT_FOUND, "Unknown config entry"
+        )
+    return myLibrary
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/materials",
+        vol.Required("entry_id"): str,
+        vol.Required("list"): vol.In(list(LISTS)),
+        vol.Optional("offset", default=0): vol.All(int, vol.Range(min=0)),
+        vol.Optional("limit", default=50): vol.All(int, vol.Range(min=1)),
+    }
+)
+@callback
+def websocket_get_materials(hass: HomeAssistant, connection, msg) -> None:
+    """Return a page of a list of materials."""
+    if (myLibrary := _getLibrary(hass, connection, msg)) is None:
+        return
+
+    key = LISTS[msg["list"]]
+    start = msg["offset"]
+    connection.send_result(
+        msg["id"],
+        {
+            "total": len(myLibrary.getList(key)),
+            "materials": [
+                _materialToJSON(material)
+                for material in myLibrary.iterMaterials(key, start, start + msg["limit"])
+            ],
+        },
+    )
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/subscribe",
+        vol.Required("entry_id"): str,
+        vol.Optional("lists"): [vol.In(list(LISTS))],
+    }
+)
+@callback
+def websocket_subscribe_materials(hass: HomeAssistant, connection, msg) -> None:
+    """Send the changes of the materials after every update."""
+    if _getLibrary(hass, connection, msg) is None:
+        return
+
+    keys = {LISTS[name] for name in msg.get("lists", LISTS)}
+
+    @callback
+    def async_changed(changes: dict) -> None:
+        for key, (added, removed, changed) in changes.items():
+            if key not in keys or not (added or removed or changed):
+                continue
+            connection.send_event(
+                msg["id"],
+                {
+                    "list": key.lower(),
+                    "added": [_materialToJSON(material) for material in added],
+                    "removed": [material.key for material in removed],
+                    "changed": [_materialToJSON(material) for material, _ in changed],
+                },
+            )
+
+    connection.subscriptions[msg["id"]] = async_dispatcher_connect(
+        hass, SIGNAL_CHANGED.format(msg["entry_id"]), async_changed
+    )
+    connection.send_result(msg["id"])
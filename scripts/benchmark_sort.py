@@ -0,0 +1,117 @@
+"""Measure the sort of the loans after an update, with and without the kept sort keys.
+
+Run from the root of the repository, with beautifulsoup4 and requests installed:
+
+    python scripts/benchmark_sort.py [size ...]
+
+Each update parses every material anew. Before, the lists were sorted
+with a lambda building the key of every material. Now the diff swaps the
+unchanged materials for their previous instance, which keeps its sort
+key, and only the new and the changed materials build a key. The diff is
+timed on its own, it is needed for the events of the changes anyway.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import importlib
+import os
+import random
+import sys
+import timeit
+import types
+
+# Load the library api without Home Assistant, as the tests do
+PACKAGE = "bibliotek_dk"
+PATH = os.path.join(os.path.dirname(__file__), "..", "custom_components", PACKAGE)
+package = types.ModuleType(PACKAGE)
+package.__path__ = [PATH]
+sys.modules[PACKAGE] = package
+api = importlib.import_module(f"{PACKAGE}.library_api")
+
+SIZES = (5_500, 55_000)
+REPEAT = 5
+CHANGED = 0.01  # part of the loans with a new due date on the next update
+
+
+# The loans of one update as parsed from the pages, listed by their due
+# date as the library does, or in no order at all
+def parseLoans(size: int, shuffled: bool, changed: frozenset = frozenset()) -> list:
+    start, rng = datetime(2099, 1, 1), random.Random(1)
+    order = rng.sample(range(size), size) if shuffled else range(size)
+    loans = []
+    for n in order:
+        loan = api.libraryLoan()
+        loan.info = api.internMaterialInfo(
+            f"/ting/object/{n}", None, "Bog", f"Titel {n}", "Forfatter"
+        )
+        loan.renewId, loan.renewAble = str(n), True
+        loan.loanDate = start - timedelta(days=30)
+        loan.expireDate = start + timedelta(days=n * 60 // size + (n in changed))
+        loans.append(loan)
+    return loans
+
+
+def oldSort(loans: list) -> None:
+    loans.sort(key=lambda obj: (obj.expireDate is None, obj.expireDate, obj.title))
+
+
+def newSort(previous: list, loans: list) -> None:
+    added, _, changed = api.diffMaterials(previous, loans)
+    for material in added:
+        material.buildSortKey()
+    for material, _ in changed:
+        material.buildSortKey()
+    loans.sort(key=api.SORT_KEY)
+
+
+# The best of the repeats in milliseconds, each run on a fresh parse
+def measure(run, setup) -> float:
+    times = []
+    for _ in range(REPEAT):
+        args = setup()
+        times.append(timeit.timeit(lambda: run(*args), number=1))
+    return min(times) * 1000
+
+
+def main(sizes) -> None:
+    print(
+        f"{'loans':>8} {'order':>9} {'changed':>8}"
+        f" {'lambda':>10} {'kept keys':>10} {'diff':>10}"
+    )
+    for size, shuffled in ((size, shuffled) for size in sizes for shuffled in (False, True)):
+        previous = parseLoans(size, shuffled)
+        newSort([], previous)
+        for part in (0, CHANGED):
+            changed = frozenset(random.Random(2).sample(range(size), int(size * part)))
+
+            def fresh() -> tuple:
+                return (parseLoans(size, shuffled, changed),)
+
+            def freshDiffed() -> tuple:
+                loans = parseLoans(size, shuffled, changed)
+                added, _, changes = api.diffMaterials(list(previous), loans)
+                for material in added:
+                    material.buildSortKey()
+                for material, _ in changes:
+                    material.buildSortKey()
+                return (loans,)
+
+            lambdaSort = measure(oldSort, fresh)
+            # The sort alone, after the diff has swapped in the kept keys
+            keptSort = measure(lambda loans: loans.sort(key=api.SORT_KEY), freshDiffed)
+            diff = measure(lambda loans: api.diffMaterials(list(previous), loans), fresh)
+            print(
+                f"{size:>8} {'shuffled' if shuffled else 'due date':>9} {len(changed):>8}"
+                f" {lambdaSort:>8.2f}ms"
+                f" {keptSort:>8.2f}ms {diff:>8.2f}ms"
+            )
+    # The same order either way
+    before, after = parseLoans(SIZES[0], True), parseLoans(SIZES[0], True)
+    oldSort(before)
+    newSort([], after)
+    assert [loan.renewId for loan in before] == [loan.renewId for loan in after]
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or SIZES)
@@ -0,0 +1,78 @@
+"""Generate the snapshot of the libraries bundled with the integration.
+
+Run from the root of the repository, with requests and beautifulsoup4 installed:
+
+    python scripts/generate_libraries.py
+
+The list is read from the same "fallback" loginpage as the integration
+uses, and written to custom_components/bibliotek_dk/libraries.json.
+"""
+from __future__ import annotations
+
+from bs4 import BeautifulSoup as BS
+from datetime import datetime, timezone
+
+import json
+import os
+import re
+import requests
+
+# Kept in step with const.py and catalogue.py
+URL = "https://fmbib.dk/adgangsplatformen/login?destination=ding_frontpage"
+HOST_PATTERN = re.compile(r"^.+?[^\/:](?=[?\/]|$)")
+SNAPSHOT_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "custom_components", "bibliotek_dk", "libraries.json"
+)
+SNAPSHOT_VERSION = 1
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36"
+
+
+def fetchLibraries() -> list:
+    r = requests.get(URL, headers={"User-Agent": USER_AGENT}, timeout=(5, 20))
+    r.raise_for_status()
+
+    soup = BS(r.text, "html.parser")
+    librariesJSON = json.loads(
+        soup.find(
+            "script",
+            text=re.compile(r"^var libraries = (.)", re.MULTILINE | re.DOTALL),
+        ).string.replace("var libraries = ", "")
+    )
+
+    directory = []
+    for library in librariesJSON["folk"]:
+        directory.append(
+            {
+                "name": library["name"],
+                "branchId": library["branchId"],
+                "host": HOST_PATTERN.match(library["registrationUrl"]).group(),
+                "gatewayf": "gatewayf" in library["registrationUrl"],
+            }
+        )
+
+    # Sorted, so a new snapshot only differs where the libraries did
+    return sorted(directory, key=lambda library: library["name"])
+
+
+def main() -> None:
+    directory = fetchLibraries()
+    if not directory:
+        raise SystemExit("No libraries found, the snapshot is left as is")
+
+    with open(SNAPSHOT_FILE, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "version": SNAPSHOT_VERSION,
+                "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "folk": directory,
+            },
+            file,
+            ensure_ascii=False,
+            indent=1,
+        )
+        file.write("\n")
+    print(f"Wrote {len(directory)} libraries to {os.path.normpath(SNAPSHOT_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
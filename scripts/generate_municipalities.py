@@ -0,0 +1,115 @@
+"""Generate the municipality boundaries bundled with the integration.
+
+Run from the root of the repository, with requests installed:
+
+    python scripts/generate_municipalities.py
+
+The boundaries are read from the API of dataforsyningen.dk, simplified
+and written to custom_components/bibliotek_dk/municipalities.json.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import json
+import os
+import requests
+
+URL = "https://api.dataforsyningen.dk/kommuner?format=geojson&srid=4326"
+BOUNDARIES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "bibliotek_dk",
+    "municipalities.json",
+)
+BOUNDARIES_VERSION = 1
+# Largest distance to the simplified boundary, in degrees (about 50 meters)
+TOLERANCE = 0.0005
+DECIMALS = 5
+
+
+def _distance(point, start, end) -> float:
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    if not dx and not dy:
+        return ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+    return abs(dy * x - dx * y + x2 * y1 - y2 * x1) / (dx * dx + dy * dy) ** 0.5
+
+
+# Douglas-Peucker, without recursion since the rings are long
+def simplify(ring: list, tolerance: float = TOLERANCE) -> list:
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        index, largest = None, tolerance
+        for i in range(first + 1, last):
+            distance = _distance(ring[i], ring[first], ring[last])
+            if distance > largest:
+                index, largest = i, distance
+        if index is not None:
+            keep[index] = True
+            stack.extend(((first, index), (index, last)))
+    return [point for point, kept in zip(ring, keep) if kept]
+
+
+def rings(geometry: dict) -> list:
+    polygons = (
+        [geometry["coordinates"]]
+        if geometry["type"] == "Polygon"
+        else geometry["coordinates"]
+    )
+    result = []
+    for polygon in polygons:
+        for ring in polygon:
+            ring = [
+                [round(lon, DECIMALS), round(lat, DECIMALS)]
+                for lon, lat in simplify(ring)
+            ]
+            # A ring needs at least three corners and the closing point
+            if len(ring) > 3:
+                result.append(ring)
+    return result
+
+
+def fetchMunicipalities() -> list:
+    r = requests.get(URL, timeout=(5, 120))
+    r.raise_for_status()
+
+    municipalities = []
+    for feature in r.json()["features"]:
+        if feature.get("geometry") and (result := rings(feature["geometry"])):
+            municipalities.append(
+                {"name": feature["properties"]["navn"], "rings": result}
+            )
+
+    # Sorted, so a new file only differs where the boundaries did
+    return sorted(municipalities, key=lambda municipality: municipality["name"])
+
+
+def main() -> None:
+    municipalities = fetchMunicipalities()
+    if not municipalities:
+        raise SystemExit("No municipalities found, the boundaries are left as is")
+
+    with open(BOUNDARIES_FILE, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "version": BOUNDARIES_VERSION,
+                "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "municipalities": municipalities,
+            },
+            file,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        file.write("\n")
+    print(
+        f"Wrote {len(municipalities)} municipalities to {os.path.normpath(BOUNDARIES_FILE)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Load the library api of the integration without Home Assistant."""
+from __future__ import annotations
+
+import importlib
+import pathlib
+import sys
+import types
+
+import pytest
+
+# The package is registered without running its __init__, which needs
+# Home Assistant, so the modules without it can be imported on their own
+PACKAGE = "bibliotek_dk"
+PATH = pathlib.Path(__file__).parents[1] / "custom_components" / PACKAGE
+
+if PACKAGE not in sys.modules:
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [str(PATH)]
+    sys.modules[PACKAGE] = package
+
+api = importlib.import_module(f"{PACKAGE}.library_api")
+
+
+# The breakers and the login forms are shared by every account, start clean
+@pytest.fixture(autouse=True)
+def sharedState():
+    api._BREAKERS.clear()
+    api._LOGIN_FORMS.clear()
+    yield
+    api._BREAKERS.clear()
+    api._LOGIN_FORMS.clear()
+
+
+# Update again at once, without being served the update just finished
+@pytest.fixture
+def noFreshness(monkeypatch):
+    monkeypatch.setattr(api, "UPDATE_FRESHNESS", 0)
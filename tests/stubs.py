@@ -0,0 +1,272 @@
+"""A stub of a library, serving the pages the integration reads for every account."""
+from __future__ import annotations
+
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import io
+import secrets
+import threading
+
+import requests
+
+from bibliotek_dk import library_api as api
+from bibliotek_dk.const import URL_LOGIN
+
+LIBRARY_NAME = "Stubby Bibliotek"
+SESSION_COOKIE = "SESSstub"
+
+
+def materialHtml(id: str, title: str, details: list) -> str:
+    items = "".join(
+        f'<li class="{cls}"><div class="item-information-label">{cls}</div>'
+        f'<div class="item-information-data">{value}</div></li>'
+        for cls, value in details
+    )
+    return (
+        f'<div class="material-item"><input type="checkbox" value="{id}">'
+        f'<a href="/ting/object/{id}"><img src="https://covers.test/{id}.jpg"></a>'
+        f'<h3 class="item-title">{title} (bog)</h3>'
+        f'<div class="item-material-type">Bog</div>'
+        f'<div class="item-creators">Forfatter</div><ul>{items}</ul></div>'
+    )
+
+
+def pageHtml(loggedIn: bool, body: str = "") -> str:
+    title = f"{LIBRARY_NAME} | | Logget ind" if loggedIn else f"{LIBRARY_NAME} | |"
+    return (
+        f'<html><head><title>{title}</title><link rel="icon" href="/favicon.ico">'
+        f"</head><body>{body}</body></html>"
+    )
+
+
+class stubLibrary:
+    """The pages of a library with the given accounts, {userId: pincode}.
+
+    Every material carries the id of its user, so a page served to the
+    wrong account is seen in the lists. Every request is recorded.
+    """
+
+    def __init__(self, accounts: dict) -> None:
+        self.accounts = dict(accounts)
+        self.loans = {
+            userId: [f"{userId}-{n}" for n in range(3)] for userId in self.accounts
+        }
+        self.ready = {userId: [f"{userId}-r"] for userId in self.accounts}
+        # The due date of a loan by its id, when not the default
+        self.expires = {}
+        self.sessions, self.requests = {}, []
+        # The path to hold, with the events of entering it and of going on
+        self.hold = None
+        self._lock = threading.Lock()
+
+    def handle(self, method: str, path: str, form: dict, token: str | None) -> tuple:
+        """Return the status, the body and the session cookie to set, "" to delete."""
+        with self._lock:
+            self.requests.append((method, path))
+            userId = self.sessions.get(token)
+        if self.hold and path == self.hold[0]:
+            self.hold[1].set()
+            self.hold[2].wait(10)
+
+        route = path.split("?")[0]
+        if route == URL_LOGIN:
+            if method == "GET":
+                return 200, self.loginPage(), None
+            userId = form.get("loginBibDkUserId")
+            if userId in self.accounts and self.accounts[userId] == form.get("pincode"):
+                token = secrets.token_hex(8)
+                with self._lock:
+                    self.sessions[token] = userId
+                return 200, pageHtml(True), token
+            return 200, pageHtml(False), None
+        if route == "/":
+            return 200, pageHtml(userId is not None), None
+        if route == api.URLS[api.LOGOUT]:
+            with self._lock:
+                self.sessions.pop(token, None)
+            return 200, pageHtml(False), ""
+        if userId is None:
+            return 403, pageHtml(False), None
+
+        pages = {
+            api.URLS[api.USER_PROFILE]: self.profilePage,
+            api.URLS[api.LOANS]: self.loansPage,
+            api.URLS[api.LOANS_OVERDUE]: self.loansOverduePage,
+            api.URLS[api.RESERVATIONS]: self.reservationsPage,
+            api.URLS[api.RESERVATIONS_READY]: self.reservationsReadyPage,
+            api.URLS[api.DEBTS]: self.debtsPage,
+        }
+        if route not in pages:
+            return 404, "", None
+        return 200, pageHtml(True, pages[route](userId)), None
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            return sum(1 for _, requested in self.requests if requested == path)
+
+    def loginPage(self) -> str:
+        return pageHtml(
+            False,
+            '<form action="/login" method="post">'
+            '<input name="loginBibDkUserId" value="">'
+            '<input name="pincode" value="">'
+            '<input type="hidden" name="form_id" value="login"></form>',
+        )
+
+    def profilePage(self, userId: str) -> str:
+        return (
+            '<div class="content">'
+            '<div class="field field-name-name"><div class="field-label">Navn</div>'
+            f'<div class="field-items"><div>User {userId}</div></div></div>'
+            '<div class="field field-name-address"><div class="field-label">Adresse</div>'
+            f'<div class="field-items"><div>Vej {userId}<br>5000 Odense C</div></div></div>'
+            "</div>"
+            f'<form action="{api.URLS[api.USER_PROFILE]}">'
+            f'<input name="profile[phone]" value="{userId[-8:]}">'
+            '<input name="profile[phone_notification]" value="1">'
+            f'<input name="profile[mail]" value="{userId}@example.dk">'
+            '<input name="profile[mail_notification]" value="0">'
+            '<select name="profile[preferred_branch]"><option value="1">Hovedbiblioteket</option>'
+            f'<option value="2" selected>Filial {userId}</option></select></form>'
+        )
+
+    def loansPage(self, userId: str) -> str:
+        loans = "".join(
+            materialHtml(
+                id,
+                f"Lån {id}",
+                [
+                    ("loan-date", "1. jan 2024"),
+                    ("expire-date", self.expires.get(id, "1. jan 2099")),
+                    ("material-number", id),
+                ],
+            )
+            for id in self.loans[userId]
+        )
+        return f'<div class="pane-loans">{loans}</div>'
+
+    def loansOverduePage(self, userId: str) -> str:
+        return '<div class="pane-loans"></div>'
+
+    def readyPane(self, userId: str) -> str:
+        ready = "".join(
+            materialHtml(
+                id,
+                f"Afhent {id}",
+                [
+                    ("pickup-id", id),
+                    ("pickup-date", "1. jan 2099"),
+                    ("pickup-branch", "Hovedbiblioteket"),
+                ],
+            )
+            for id in self.ready[userId]
+        )
+        return f'<div class="pane-reservations">{ready}</div>'
+
+    def reservationsPage(self, userId: str) -> str:
+        pending = materialHtml(
+            f"{userId}-p",
+            f"Reserveret {userId}-p",
+            [
+                ("created-date", "1. jan 2024"),
+                ("expire-date", "1. jan 2099"),
+                ("queue-number", "3"),
+                ("pickup-branch", "Hovedbiblioteket"),
+            ],
+        )
+        return self.readyPane(userId) + f'<div class="pane-reservations">{pending}</div>'
+
+    def reservationsReadyPage(self, userId: str) -> str:
+        return self.readyPane(userId)
+
+    def debtsPage(self, userId: str) -> str:
+        debt = materialHtml(
+            f"{userId}-d",
+            f"Gebyr {userId}-d",
+            [
+                ("fee-date", "1. jan 2024"),
+                ("fee-type", "Overskredet"),
+                ("fee_amount", "12,50 kr."),
+            ],
+        )
+        return f'<div class="pane-debts">{debt}</div><span class="amount">12,50 kr.</span>'
+
+
+class stubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.respond({})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        self.respond(dict(parse_qsl(self.rfile.read(length).decode())))
+
+    def respond(self, form: dict) -> None:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        token = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+        status, body, setCookie = self.server.library.handle(
+            self.command, self.path, form, token
+        )
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if setCookie is not None:
+            expires = "; Max-Age=0" if setCookie == "" else ""
+            self.send_header(
+                "Set-Cookie", f"{SESSION_COOKIE}={setCookie or 'deleted'}; Path=/{expires}"
+            )
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class stubServer(ThreadingHTTPServer):
+    """Serve a stub library on a free port of localhost, in a thread of its own."""
+
+    daemon_threads = True
+
+    def __init__(self, library: stubLibrary) -> None:
+        super().__init__(("127.0.0.1", 0), stubHandler)
+        self.library = library
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self) -> stubServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def stubSession(library: stubLibrary, session: requests.Session, host: str) -> None:
+    """Answer the get and the post of the session from the library, without any socket."""
+    domain = urlsplit(host).hostname
+
+    def request(method, url, data=None, **kwargs) -> requests.Response:
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        path = f"{path}?{parts.query}" if parts.query else path
+        status, body, setCookie = library.handle(
+            method, path, data or {}, session.cookies.get(SESSION_COOKIE)
+        )
+        if setCookie == "":
+            session.cookies.clear(domain, "/", SESSION_COOKIE)
+        elif setCookie is not None:
+            session.cookies.set(SESSION_COOKIE, setCookie, domain=domain, path="/")
+
+        r = requests.Response()
+        r.status_code, r.url, r.encoding = status, url, "utf-8"
+        r._content = body.encode("utf-8")
+        r._content_consumed = True
+        r.raw = io.BytesIO(r._content)
+        return r
+
+    session.get = lambda url, **kwargs: request("GET", url, **kwargs)
+    session.post = lambda url, data=None, **kwargs: request("POST", url, data, **kwargs)
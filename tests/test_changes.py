@@ -0,0 +1,102 @@
+"""What changed between two updates, and the events told about it."""
+from datetime import datetime
+
+import pytest
+
+from bibliotek_dk.const import (
+    EVENT_CHANGED,
+    EVENT_LOAN_DUE_DATE_CHANGED,
+    EVENT_RESERVATION_READY,
+)
+from bibliotek_dk.events import changeEvents
+from conftest import api
+from stubs import stubLibrary, stubSession
+
+HOST = "https://bibliotek.test"
+USER_ID = "0101011234"
+
+
+@pytest.fixture
+def library() -> stubLibrary:
+    return stubLibrary({USER_ID: "1234"})
+
+
+@pytest.fixture
+def myLibrary(library, noFreshness) -> api.Library:
+    myLibrary = api.Library(USER_ID, "1234", HOST)
+    stubSession(library, myLibrary.session, HOST)
+    # Nothing has changed on the very first update
+    assert myLibrary.update() == {}
+    return myLibrary
+
+
+def nothingChanged(changes: dict) -> bool:
+    return all(
+        not added and not removed and not changed
+        for added, removed, changed in changes.values()
+    )
+
+
+def test_unchanged_materials_keep_their_instance(myLibrary):
+    loans = list(myLibrary.user.loans)
+    reservationsReady = list(myLibrary.user.reservationsReady)
+
+    assert nothingChanged(myLibrary.update())
+    assert all(a is b for a, b in zip(myLibrary.user.loans, loans))
+    assert all(a is b for a, b in zip(myLibrary.user.reservationsReady, reservationsReady))
+    assert not list(changeEvents(myLibrary.update(), {}))
+
+
+# Two copies of the same material share the key of the loan
+def test_duplicate_keys_are_not_added_again(library, myLibrary):
+    library.loans[USER_ID].append(f"{USER_ID}-0")
+
+    added, removed, changed = myLibrary.update()[api.LOANS]
+    assert [loan.id for loan in added] == [f"{USER_ID}-0"]
+    assert not removed and not changed
+    assert len(myLibrary.user.loans) == 4
+
+    # The next update finds both copies again, and nothing new
+    assert nothingChanged(myLibrary.update())
+
+    # One of the copies is returned
+    library.loans[USER_ID].remove(f"{USER_ID}-0")
+    added, removed, changed = myLibrary.update()[api.LOANS]
+    assert not added and [loan.id for loan in removed] == [f"{USER_ID}-0"]
+
+
+def test_due_date_and_ready_reservation_events(library, myLibrary):
+    library.expires[f"{USER_ID}-1"] = "15. feb 2099"
+    library.ready[USER_ID].append(f"{USER_ID}-r2")
+
+    changes = myLibrary.update()
+    added, removed, changed = changes[api.LOANS]
+    assert not added and not removed
+    [(loan, fields)] = changed
+    assert loan.id == f"{USER_ID}-1"
+    assert fields == {"expireDate": (datetime(2099, 1, 1), datetime(2099, 2, 15))}
+    added, removed, changed = changes[api.RESERVATIONS_READY]
+    assert [m.reservationNumber for m in added] == [f"{USER_ID}-r2"]
+    assert not removed and not changed
+
+    events = list(changeEvents(changes, {"entry_id": "entry", "user": "User"}))
+    byType = {}
+    for eventType, data in events:
+        byType.setdefault(eventType, []).append(data)
+
+    assert [(e["list"], e["change"]) for e in byType[EVENT_CHANGED]] == [
+        ("loans", "changed"),
+        ("reservations_ready", "added"),
+    ]
+    assert byType[EVENT_CHANGED][0]["fields"] == {
+        "expireDate": [datetime(2099, 1, 1), datetime(2099, 2, 15)]
+    }
+    [dueDate] = byType[EVENT_LOAN_DUE_DATE_CHANGED]
+    assert dueDate["material"]["id"] == f"{USER_ID}-1"
+    assert dueDate["old_expire_date"] == datetime(2099, 1, 1)
+    assert dueDate["entry_id"] == "entry" and dueDate["user"] == "User"
+    [ready] = byType[EVENT_RESERVATION_READY]
+    assert ready["material"]["reservationNumber"] == f"{USER_ID}-r2"
+
+    # Told once, the next update has nothing to tell
+    assert not list(changeEvents(myLibrary.update(), {}))
@@ -0,0 +1,46 @@
+"""Many accounts updating at once must not see anything of each other."""
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import api
+from stubs import stubLibrary, stubServer
+
+ACCOUNTS = 8
+ROUNDS = 3
+
+
+def test_parallel_updates_do_not_cross(noFreshness):
+    accounts = {f"01010{n:05d}": f"{n:04d}" for n in range(ACCOUNTS)}
+    library = stubLibrary(accounts)
+    headers = dict(api.HEADERS)
+
+    with stubServer(library) as server:
+        libraries = [
+            api.Library(userId, pincode, server.url)
+            for userId, pincode in accounts.items()
+        ]
+        with ThreadPoolExecutor(max_workers=ACCOUNTS) as pool:
+            for _ in range(ROUNDS):
+                list(pool.map(lambda myLibrary: myLibrary.update(), libraries))
+
+                for myLibrary in libraries:
+                    userId = myLibrary.user.userId
+                    assert myLibrary.lastUpdate and not myLibrary.stale
+                    assert myLibrary.user.name == f"User {userId}"
+                    assert myLibrary.user.mail == f"{userId}@example.dk"
+                    assert myLibrary.user.pickupLibrary == f"Filial {userId}"
+                    assert sorted(loan.id for loan in myLibrary.user.loans) == sorted(
+                        library.loans[userId]
+                    )
+                    assert [m.id for m in myLibrary.user.reservations] == [f"{userId}-p"]
+                    assert [m.reservationNumber for m in myLibrary.user.reservationsReady] == [
+                        f"{userId}-r"
+                    ]
+                    assert [m.title for m in myLibrary.user.debts] == [f"Gebyr {userId}-d"]
+
+    # Every account has lists and headers of its own, the defaults are untouched
+    assert api.HEADERS == headers
+    assert len({id(myLibrary.session.headers) for myLibrary in libraries}) == ACCOUNTS
+    assert len({id(myLibrary.user.loans) for myLibrary in libraries}) == ACCOUNTS
+    assert not any(
+        hasattr(api.Library, name) for name in ("loggedIn", "eLoggedIn", "running")
+    )
@@ -0,0 +1,93 @@
+"""The snapshot of the libraries, and how a live directory is merged into it."""
+import json
+import pathlib
+
+import pytest
+
+from bibliotek_dk import libraries
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def snapshot(monkeypatch) -> list:
+    monkeypatch.setattr(libraries, "SNAPSHOT_FILE", str(FIXTURES / "libraries.json"))
+    libraries.loadSnapshot.cache_clear()
+    yield libraries.loadSnapshot()
+    libraries.loadSnapshot.cache_clear()
+
+
+def test_load_snapshot(snapshot):
+    assert [library["name"] for library in snapshot] == [
+        "Faaborg-Midtfyn Bibliotekerne",
+        "Gatewayf Bibliotek",
+        "Københavns Biblioteker",
+        "Odense Bibliotekerne",
+    ]
+
+
+@pytest.mark.parametrize(
+    "content", ["", "{", json.dumps({"version": 0, "folk": [{"name": "Old"}]})]
+)
+def test_load_broken_snapshot(monkeypatch, tmp_path, content):
+    path = tmp_path / "libraries.json"
+    path.write_text(content, encoding="utf-8")
+    monkeypatch.setattr(libraries, "SNAPSHOT_FILE", str(path))
+    libraries.loadSnapshot.cache_clear()
+    assert libraries.loadSnapshot() == []
+    libraries.loadSnapshot.cache_clear()
+
+
+def test_split_directory(snapshot):
+    usable, excluded = libraries.splitDirectory(snapshot)
+    assert list(excluded) == ["Gatewayf Bibliotek"]
+    assert usable["Odense Bibliotekerne"] == {
+        "agency": "100004",
+        "host": "https://odense.bibliotek.test",
+    }
+    assert len(usable) == 3
+
+
+def test_merge_directory(snapshot):
+    live = [dict(library) for library in reversed(snapshot)]
+    # One moved to a new host, one closed and one opened
+    live[0]["host"] = "https://odense.test"
+    live = [library for library in live if library["name"] != "Gatewayf Bibliotek"]
+    live.append(
+        {
+            "name": "Aarhus Bibliotekerne",
+            "branchId": "100005",
+            "host": "https://aarhus.test",
+            "gatewayf": False,
+        }
+    )
+
+    merged, changes = libraries.mergeDirectory(snapshot, live)
+    assert changes == (1, 1, 1)
+    # The known order is kept, the new ones come last
+    assert [library["name"] for library in merged] == [
+        "Faaborg-Midtfyn Bibliotekerne",
+        "Københavns Biblioteker",
+        "Odense Bibliotekerne",
+        "Aarhus Bibliotekerne",
+    ]
+    assert merged[2]["host"] == "https://odense.test"
+
+
+def test_index_resolves_municipalities(snapshot):
+    index = libraries.libraryIndex(snapshot)
+    assert index.resolve("Faaborg-Midtfyn") == "Faaborg-Midtfyn Bibliotekerne"
+    assert index.resolve("København") == "Københavns Biblioteker"
+    assert index.resolve("Odense Bibliotekerne") == "Odense Bibliotekerne"
+    assert index.resolve("Vejle") is None
+
+
+# The snapshot bundled in a release, generated by scripts/generate_libraries.py
+def test_bundled_snapshot():
+    if not pathlib.Path(libraries.SNAPSHOT_FILE).exists():
+        pytest.skip("libraries.json is not generated, see Development in the README")
+    libraries.loadSnapshot.cache_clear()
+    directory = libraries.loadSnapshot()
+    assert directory, "The bundled libraries.json has no libraries"
+    usable, _ = libraries.splitDirectory(directory)
+    assert all(library["host"].startswith("https://") for library in usable.values())
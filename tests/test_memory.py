@@ -0,0 +1,58 @@
+"""The memory of an account does not grow from refresh to refresh."""
+import gc
+import pathlib
+
+import pytest
+from bs4 import BeautifulSoup as BS
+
+from conftest import api
+from stubs import stubLibrary, stubSession
+
+HOST = "https://bibliotek.test"
+STATUS = pathlib.Path("/proc/self/status")
+WARMUP, REFRESHES = 100, 1000
+# Bytes the resident set may grow over all the refreshes
+RSS_GROWTH = 8 * 1024 * 1024
+
+
+def rss() -> int:
+    for line in STATUS.read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+    raise ValueError("No VmRSS in /proc/self/status")
+
+
+def soups() -> int:
+    gc.collect()
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, BS))
+
+
+@pytest.mark.skipif(not STATUS.exists(), reason="Needs /proc to read the RSS")
+def test_rss_is_flat_over_refreshes(noFreshness):
+    userId = "0101011234"
+    library = stubLibrary({userId: "1234"})
+    myLibrary = api.Library(userId, "1234", HOST)
+    stubSession(library, myLibrary.session, HOST)
+
+    def refresh(n: int) -> None:
+        # A loan is returned and another is borrowed on every refresh
+        library.loans[userId] = [f"{userId}-{i}" for i in range(n, n + 3)]
+        myLibrary.update()
+        # Only the requests of the current refresh are of interest
+        library.requests.clear()
+
+    for n in range(WARMUP):
+        refresh(n)
+    gc.collect()
+    before = rss()
+
+    for n in range(WARMUP, WARMUP + REFRESHES):
+        refresh(n)
+    gc.collect()
+
+    assert myLibrary.lastUpdate and not myLibrary.stale
+    assert sorted(loan.id for loan in myLibrary.user.loans) == sorted(library.loans[userId])
+    # No parsed page outlives the refresh, neither on the account nor anywhere else
+    assert not any(isinstance(value, BS) for value in vars(myLibrary).values())
+    assert soups() == 0
+    assert rss() - before < RSS_GROWTH
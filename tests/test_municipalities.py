@@ -0,0 +1,97 @@
+"""The offline reverse geocoding of the municipalities, and the simplified boundaries."""
+import importlib.util
+import pathlib
+
+import pytest
+
+from bibliotek_dk import municipalities
+
+SCRIPT = pathlib.Path(__file__).parents[1] / "scripts" / "generate_municipalities.py"
+spec = importlib.util.spec_from_file_location("generate_municipalities", SCRIPT)
+generate = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(generate)
+
+
+def square(west, south, east, north) -> list:
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+# A municipality with a lake in the middle and an island to the east,
+# and another municipality filling the lake, as an enclave
+RINGBY = {
+    "name": "Ringby",
+    "rings": [
+        square(10.0, 55.0, 11.0, 56.0),
+        square(10.4, 55.4, 10.6, 55.6),
+        square(11.5, 55.2, 11.7, 55.4),
+    ],
+}
+HULBY = {"name": "Hulby", "rings": [square(10.4, 55.4, 10.6, 55.6)]}
+
+
+@pytest.fixture
+def resolver() -> municipalities.municipalityResolver:
+    return municipalities.municipalityResolver([RINGBY, HULBY])
+
+
+def test_resolve_the_mainland(resolver):
+    assert resolver.resolve(10.2, 55.2) == "Ringby"
+    assert resolver.resolve(10.9, 55.9) == "Ringby"
+
+
+def test_resolve_a_hole(resolver):
+    assert resolver.resolve(10.5, 55.5) == "Hulby"
+    # Without the enclave the hole belongs to nobody
+    assert municipalities.municipalityResolver([RINGBY]).resolve(10.5, 55.5) is None
+
+
+def test_resolve_an_island(resolver):
+    assert resolver.resolve(11.6, 55.3) == "Ringby"
+    # The sea between the mainland and the island is in the bounding box only
+    assert resolver.resolve(11.3, 55.3) is None
+
+
+def test_resolve_outside_every_bounding_box(resolver):
+    assert resolver.resolve(12.5, 57.0) is None
+    assert resolver.resolve(-10.0, -55.0) is None
+
+
+def test_rings_too_small_are_skipped():
+    resolver = municipalities.municipalityResolver(
+        [{"name": "Streg", "rings": [[[10.0, 55.0], [11.0, 55.0]]]}]
+    )
+    assert resolver.municipalities == [] and resolver.resolve(10.5, 55.0) is None
+
+
+def test_simplify_drops_points_within_the_tolerance():
+    # A straight edge with a wobble of about 10 meters
+    edge = [[10.0 + i * 0.001, 55.0 + (0.0001 if i % 2 else 0)] for i in range(101)]
+    assert generate.simplify(edge) == [edge[0], edge[-1]]
+
+
+def test_simplify_keeps_the_corners():
+    ring = square(10.0, 55.0, 11.0, 56.0)
+    # Extra points along the edges are not corners
+    detailed = [ring[0], [10.5, 55.0], ring[1], [11.0, 55.5], ring[2], ring[3], ring[4]]
+    assert generate.simplify(detailed) == ring
+
+
+def test_simplified_rings_still_resolve():
+    wobbly = [[10.0 + i * 0.01, 55.0 + (0.0001 if i % 2 else 0)] for i in range(101)]
+    ring = wobbly + [[11.0, 56.0], [10.0, 56.0], [10.0, 55.0]]
+    rings = generate.rings({"type": "Polygon", "coordinates": [ring]})
+    assert len(rings) == 1 and len(rings[0]) < len(ring)
+    resolver = municipalities.municipalityResolver([{"name": "Ringby", "rings": rings}])
+    assert resolver.resolve(10.5, 55.5) == "Ringby"
+    assert resolver.resolve(10.5, 54.99) is None
+
+
+# The boundaries bundled in a release, generated by scripts/generate_municipalities.py
+def test_bundled_boundaries():
+    if not pathlib.Path(municipalities.BOUNDARIES_FILE).exists():
+        pytest.skip("municipalities.json is not generated, see Development in the README")
+    municipalities.loadResolver.cache_clear()
+    resolver = municipalities.loadResolver()
+    assert len(resolver.municipalities) == 98
+    # Odense Rådhus
+    assert resolver.resolve(10.3883, 55.3959) == "Odense"
@@ -0,0 +1,107 @@
+"""A streamed page is read only until its panes have closed, and parses as the full page."""
+import io
+
+import pytest
+import requests
+from bs4 import BeautifulSoup as BS
+
+from conftest import api
+from stubs import materialHtml, pageHtml
+
+HOST = "https://bibliotek.test"
+FOOTER = "<footer>" + "<p>Åbningstider og kontakt</p>" * 500 + "</footer>"
+
+
+def loan(id: str) -> str:
+    return materialHtml(
+        id,
+        f"Lån {id}",
+        [("loan-date", "1. jan 2024"), ("expire-date", "1. jan 2099"), ("material-number", id)],
+    )
+
+
+def debt(id: str) -> str:
+    return materialHtml(
+        id,
+        f"Gebyr {id}",
+        [("fee-date", "1. jan 2024"), ("fee-type", "Overskredet"), ("fee_amount", "12,50 kr.")],
+    )
+
+
+# The loans grouped in divs of their own, with empty and void elements between them
+LOANS_PAGE = pageHtml(
+    True,
+    '<nav class="menu">' + "<a href='/'>Forside</a>" * 200 + "</nav>"
+    '<div class="pane-loans">'
+    f'<div class="group"><div class="group-title">Afleveres snart</div>{loan("1")}{loan("2")}</div>'
+    f'<div></div><br><div class="group"><div><div>{loan("3")}</div></div></div>{loan("4")}'
+    "</div>"
+    # Materials after the pane are not loans
+    f'<div class="recommended">{loan("5")}</div>{FOOTER}',
+)
+DEBTS_PAGE = pageHtml(
+    True,
+    f'<div class="pane-debts"><div class="group">{debt("1")}{debt("2")}</div></div>'
+    f'<div class="total"><span class="amount">25,00 kr.</span></div>{FOOTER}',
+)
+
+
+# Read the page as the library does, streamed in chunks of the given size
+def readPage(monkeypatch, page: str, reader: api.paneReader, size: int) -> str:
+    monkeypatch.setattr(api, "STREAM_CHUNK_SIZE", size)
+    r = requests.Response()
+    r.status_code, r.encoding = 200, "utf-8"
+    r._content = page.encode("utf-8")
+    r._content_consumed = True
+    r.raw = io.BytesIO(r._content)
+    return api.Library("0101011234", "1234", HOST)._readPage(HOST, r, reader)
+
+
+# A chunk size cutting the first mention of the class in two
+def splitting(page: str, cls: str) -> int:
+    return page.encode("utf-8").index(cls.encode("utf-8")) + len(cls) // 2
+
+
+def loans(page: str) -> list:
+    myLibrary = api.Library("0101011234", "1234", HOST)
+    return [material.asDict() for material in myLibrary.fetchLoans(BS(page, "html.parser"))]
+
+
+def debts(page: str) -> tuple:
+    myLibrary = api.Library("0101011234", "1234", HOST)
+    soup = BS(page, "html.parser")
+    amount = soup.select_one("span[class='amount']")
+    return (
+        [material.asDict() for material in myLibrary.iterDebts(soup)],
+        myLibrary._removeCurrency(myLibrary._text(amount)),
+    )
+
+
+@pytest.mark.parametrize("size", [1, 7, splitting(LOANS_PAGE, "pane-loans"), 8192])
+def test_loans_read_as_the_full_page(monkeypatch, size):
+    text = readPage(monkeypatch, LOANS_PAGE, api.paneReader(("div", "pane-loans")), size)
+
+    # The reading stops after the pane, before the footer
+    assert len(text) < LOANS_PAGE.index("<footer>") + size
+    expected = loans(LOANS_PAGE)
+    assert [loan["id"] for loan in expected] == ["1", "2", "3", "4"]
+    assert loans(text) == expected
+
+
+@pytest.mark.parametrize(
+    "size",
+    [1, 7, splitting(DEBTS_PAGE, "pane-debts"), splitting(DEBTS_PAGE, '"amount"')],
+)
+def test_debts_read_to_the_amount(monkeypatch, size):
+    reader = api.paneReader(("div", "pane-debts"), ("span", "amount"))
+    text = readPage(monkeypatch, DEBTS_PAGE, reader, size)
+
+    assert len(text) < DEBTS_PAGE.index("<footer>") + size
+    expected = debts(DEBTS_PAGE)
+    assert len(expected[0]) == 2 and expected[1] == 25.0
+    assert debts(text) == expected
+
+
+def test_page_without_the_pane_is_read_to_the_end(monkeypatch):
+    page = pageHtml(False, FOOTER)
+    assert readPage(monkeypatch, page, api.paneReader(("div", "pane-loans")), 7) == page
@@ -0,0 +1,75 @@
+"""The reservations from a single page match those from a page each."""
+import pathlib
+
+import pytest
+from bs4 import BeautifulSoup as BS
+
+from conftest import api
+
+FIXTURES = pathlib.Path(__file__).parent / "fixtures"
+HOST = "https://bibliotek.test"
+
+
+def fixture(name: str) -> BS:
+    return BS((FIXTURES / name).read_text(encoding="utf-8"), "html.parser")
+
+
+def asDicts(materials: list) -> list:
+    return [material.asDict() for material in materials]
+
+
+# Fetching a page from the fixture served at its path
+@pytest.fixture
+def myLibrary(monkeypatch):
+    myLibrary = api.Library("0101011234", "1234", HOST)
+    pages = {
+        HOST + api.URLS[api.RESERVATIONS]: "library_reservations.html",
+        HOST + api.URLS[api.RESERVATIONS_READY]: "library_reservations_ready.html",
+    }
+    myLibrary.fetched = []
+
+    def fetchPage(url, payload=None, return_r=False, reader=None):
+        myLibrary.fetched.append(url)
+        return fixture(pages[url])
+
+    monkeypatch.setattr(myLibrary, "_fetchPage", fetchPage)
+    return myLibrary
+
+
+def test_library_single_page_matches_two_pages(myLibrary):
+    reservations = myLibrary.fetchReservations()
+    reservationsReady = myLibrary.fetchReservationsReady()
+    assert len(myLibrary.fetched) == 2
+
+    myLibrary.fetched.clear()
+    single, singleReady = myLibrary.fetchAllReservations()
+    assert myLibrary.fetched == [HOST + api.URLS[api.RESERVATIONS]]
+
+    assert asDicts(single) == asDicts(reservations)
+    assert asDicts(singleReady) == asDicts(reservationsReady)
+    assert [m.reservationNumber for m in singleReady] == ["A-17", "A-18"]
+    assert [m.queueNumber for m in single] == ["4", "12"]
+
+
+# The ready reservations of eReolen have no pickup id or pickup date
+def test_ereolen_single_page_matches_two_pages(myLibrary):
+    reservations = myLibrary.fetchReservations(fixture("ereolen_user.html"))
+    reservationsReady = myLibrary.fetchReservationsReady(fixture("ereolen_user.html"))
+
+    single, singleReady = myLibrary.fetchAllReservations(fixture("ereolen_user.html"))
+    assert not myLibrary.fetched
+
+    assert asDicts(single) == asDicts(reservations)
+    assert asDicts(singleReady) == asDicts(reservationsReady)
+    assert [m.title for m in singleReady] == ["Mørket"]
+    assert [m.title for m in single] == ["Stormen"]
+
+
+def test_fallback_fetches_a_page_each(myLibrary, monkeypatch):
+    monkeypatch.setattr(api, "RESERVATIONS_SINGLE_PAGE", False)
+    reservations, reservationsReady = myLibrary.fetchAllReservations()
+    assert myLibrary.fetched == [
+        HOST + api.URLS[api.RESERVATIONS],
+        HOST + api.URLS[api.RESERVATIONS_READY],
+    ]
+    assert len(reservations) == 2 and len(reservationsReady) == 2
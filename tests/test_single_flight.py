@@ -0,0 +1,116 @@
+"""Refreshes requested at once run a single update, and report its changes once."""
+import threading
+import time
+
+from conftest import api
+from stubs import stubLibrary, stubSession
+
+HOST = "https://bibliotek.test"
+JOINERS = 5
+
+
+def test_refreshes_join_the_running_update(noFreshness, monkeypatch):
+    userId = "0101011234"
+    library = stubLibrary({userId: "1234"})
+    myLibrary = api.Library(userId, "1234", HOST)
+    stubSession(library, myLibrary.session, HOST)
+
+    # Nothing has changed on the very first update
+    assert myLibrary.update() == {}
+    library.requests.clear()
+
+    # Hold the update at the loans, while every other refresh is asked for
+    library.loans[userId].append(f"{userId}-new")
+    entered, release = threading.Event(), threading.Event()
+    library.hold = (api.URLS[api.LOANS], entered, release)
+
+    results = []
+
+    def refresh() -> None:
+        results.append(myLibrary.update())
+
+    leader = threading.Thread(target=refresh)
+    leader.start()
+    assert entered.wait(10)
+    joiners = [threading.Thread(target=refresh) for _ in range(JOINERS)]
+    for joiner in joiners:
+        joiner.start()
+    deadline = time.monotonic() + 10
+    while myLibrary.collapsed < JOINERS and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + joiners:
+        thread.join(10)
+
+    # One update fetched every page once, for all the refreshes
+    assert myLibrary.collapsed == JOINERS
+    assert len(library.requests) == len(set(library.requests))
+    assert library.count(api.URLS[api.LOANS]) == 1
+    assert sum(method == "POST" for method, _ in library.requests) == 1
+
+    # Only the refresh which ran the update reports the new loan
+    reported = [changes for changes in results if changes]
+    assert len(results) == JOINERS + 1 and len(reported) == 1
+    added, removed, changed = reported[0][api.LOANS]
+    assert [loan.id for loan in added] == [f"{userId}-new"] and not removed and not changed
+
+    # Right after, the update just finished is used without any request
+    monkeypatch.setattr(api, "UPDATE_FRESHNESS", 30)
+    library.hold, requests = None, len(library.requests)
+    assert myLibrary.update() == {}
+    assert len(library.requests) == requests
+    assert myLibrary.collapsed == JOINERS + 1
+
+
+def test_joiners_fail_with_the_running_update(monkeypatch):
+    myLibrary = api.Library("0101011234", "1234", HOST)
+    entered, release = threading.Event(), threading.Event()
+    runs = []
+
+    def failingUpdate() -> dict:
+        runs.append(1)
+        entered.set()
+        release.wait(10)
+        raise RuntimeError("Broken page")
+
+    monkeypatch.setattr(myLibrary, "_update", failingUpdate)
+    errors = []
+
+    def refresh() -> None:
+        try:
+            myLibrary.update()
+        except RuntimeError as err:
+            errors.append(err)
+
+    leader = threading.Thread(target=refresh)
+    leader.start()
+    assert entered.wait(10)
+    joiner = threading.Thread(target=refresh)
+    joiner.start()
+    deadline = time.monotonic() + 10
+    while myLibrary.collapsed < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in (leader, joiner):
+        thread.join(10)
+
+    # Both the leader and the joiner see the failure
+    assert len(runs) == 1 and len(errors) == 2
+
+    # A failed update is not served again, the next refresh runs anew
+    entered.clear()
+    refresh()
+    assert len(runs) == 2 and len(errors) == 3
+
+
+def test_unavailable_update_is_not_served_again(monkeypatch):
+    myLibrary = api.Library("0101011234", "1234", HOST)
+    runs = []
+
+    def unavailableUpdate() -> dict:
+        runs.append(1)
+        raise api.libraryUnavailable("Down for maintenance")
+
+    monkeypatch.setattr(myLibrary, "_update", unavailableUpdate)
+    assert myLibrary.update() == {} and myLibrary.stale
+    assert myLibrary.update() == {} and len(runs) == 2
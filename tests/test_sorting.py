@@ -0,0 +1,58 @@
+"""The lists are sorted by urgency, before the most urgent are put in the attributes."""
+from conftest import api
+from stubs import stubLibrary, stubSession
+
+HOST = "https://bibliotek.test"
+
+
+def test_reservations_sort_by_queue_number_as_a_number():
+    reservations = []
+    for queueNumber in ("12", "4", None, "1"):
+        reservation = api.libraryReservation()
+        reservation.queueNumber = queueNumber
+        reservation.buildSortKey()
+        reservations.append(reservation)
+
+    reservations.sort(key=api.SORT_KEY)
+    assert [r.queueNumber for r in reservations] == ["1", "4", "12", None]
+
+
+# A snapshot from before keeps the queue number as text as well
+def test_restored_reservations_sort_by_queue_number():
+    reservations = [
+        api.libraryReservation.fromJSON({"queueNumber": queueNumber, "title": "T"})
+        for queueNumber in ("12", "4")
+    ]
+    reservations.sort(key=api.SORT_KEY)
+    assert [r.queueNumber for r in reservations] == ["4", "12"]
+
+
+# Only the new and the changed materials build a sort key on an update
+def test_update_builds_sort_keys_of_what_changed(noFreshness, monkeypatch):
+    userId = "0101011234"
+    library = stubLibrary({userId: "1234"})
+    library.loans[userId] = [f"{userId}-{n}" for n in range(500)]
+    myLibrary = api.Library(userId, "1234", HOST)
+    stubSession(library, myLibrary.session, HOST)
+
+    built = []
+    getSortKey = api.libraryLoan._getSortKey
+
+    def countingSortKey(self) -> tuple:
+        built.append(self.id)
+        return getSortKey(self)
+
+    monkeypatch.setattr(api.libraryLoan, "_getSortKey", countingSortKey)
+    myLibrary.update()
+    assert len(built) == 500
+
+    # One loan moved to the front, and one new
+    built.clear()
+    library.expires[f"{userId}-250"] = "1. dec 2098"
+    library.loans[userId].append(f"{userId}-new")
+    myLibrary.update()
+    assert sorted(built) == [f"{userId}-250", f"{userId}-new"]
+    assert myLibrary.user.loans[0].id == f"{userId}-250"
+    assert [loan.sortKey for loan in myLibrary.user.loans] == sorted(
+        getSortKey(loan) for loan in myLibrary.user.loans
+    )